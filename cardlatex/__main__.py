@@ -7,7 +7,10 @@ from typing import Tuple
 import click
 
 from . import version, tempdir
-from .pdf import grid_pdf, combine_pdf
+from .distributed import distribute, serve
+from .pdf import grid_pdf, combine_pdf, optimize_pdf
+from .progress import Progress
+from .check import CheckError
 from .tex import Tex
 
 
@@ -21,9 +24,48 @@ from .tex import Tex
               help='Arranges all cards in grids in either A4 or A3 sizes.')
 @click.option('-d', '--draft', is_flag=True,
               help=r'Resample all images to a much smaller size to improve compilation speeds.')
+@click.option('--where', metavar='EXPRESSION',
+              help=r'Compile only the rows for which EXPRESSION is true, e.g. \'type == "spell" and cost > 3\'; '
+                   r'overrides \cardlatex[where].')
+@click.option('--check', is_flag=True,
+              help='Only check the data and templates for problems which would fail compilation, see --no-check.')
+@click.option('--no-check', is_flag=True,
+              help='Compile without first checking the data and templates for problems, such as unescaped TeX characters.')
+@click.option('-e', '--escape', is_flag=True,
+              help=r'Escape TeX special characters in the data, e.g. & as \&, instead of reporting them.')
+@click.option('-k', '--keep-going', is_flag=True,
+              help='Replace rows which fail to compile with placeholder cards and report them, instead of failing the build.')
+@click.option('-f', '--fail-fast', is_flag=True,
+              help='Abort XeLaTeX at the first compilation error, instead of compiling every card first.')
+@click.option('--no-externalize', is_flag=True,
+              help=r'Typeset the static part of \cardlatex[front] and \cardlatex[back] for every card, instead of once.')
+@click.option('-b', '--build-dir', type=click.Path(file_okay=False),
+              help='Directory in which all intermediate files are built, e.g. a RAM disk such as /dev/shm.')
+@click.option('-m', '--matrix', is_flag=True,
+              help='Build a PDF file for every variant (e.g. title@lang=en columns, cardlatex@lang=en worksheets) in the .xlsx file.')
+@click.option('-o', '--optimize', is_flag=True,
+              help='Downsample images to --optimize-dpi at the size of a card, and compress the output PDF files further.')
+@click.option('--optimize-dpi', type=click.IntRange(min=1), default=300, show_default=True,
+              help='Resolution of the images in the output PDF files, with --optimize.')
+@click.option('--artifact-cache', metavar='LOCATION',
+              help='Pull compiled cards from, and push them to, a cache shared by several machines, e.g. a directory on a '
+                   'shared volume. Defaults to the CARDLATEX_ARTIFACT_CACHE environment variable.')
+@click.option('-w', '--workers', metavar='ADDRESS', multiple=True,
+              help='Build shards of cards on the worker at ADDRESS (host:port or the path of a Unix socket), see --serve. '
+                   'Repeat for more workers.')
+@click.option('--shard-size', type=click.IntRange(min=1), default=16, show_default=True,
+              help='Number of rows each worker builds at a time, with --workers.')
+@click.option('--worker-timeout', type=click.FloatRange(min=0, min_open=True), default=600., show_default=True,
+              help='Seconds to wait for a worker, after which its shard is retried on another worker.')
+@click.option('--serve', 'serve_address', metavar='ADDRESS',
+              help='Run as a worker for --workers at ADDRESS (host:port or the path of a Unix socket), until interrupted. '
+                   'Without a host, e.g. :5000, only local connections are accepted.')
 @click.option('--debug', is_flag=True, hidden=True)
 @click.version_option(version)
-def build(tex: Tuple[Path, ...], build_all: bool, combine: bool, paper: bool, draft: bool, debug: bool):
+def build(tex: Tuple[Path, ...], build_all: bool, combine: bool, paper: bool, draft: bool, where: str | None,
+          check: bool, no_check: bool, escape: bool, keep_going: bool, fail_fast: bool,
+          no_externalize: bool, build_dir: Path | None, matrix: bool, optimize: bool, optimize_dpi: int,
+          artifact_cache: str | None, workers: Tuple[str, ...], shard_size: int, worker_timeout: float, serve_address: str | None, debug: bool):
     start = datetime.now()
     context = click.get_current_context()
     logging.info(f'cardlatex {version}\t{context.params}')
@@ -37,18 +79,48 @@ def build(tex: Tuple[Path, ...], build_all: bool, combine: bool, paper: bool, dr
 
     try:
         kwargs = {key: value for key, value in locals().items() if key in context.params and key != 'tex'}
-        builds: list[Tex] = [Tex(path).build(**kwargs) for path in tex]
+        if serve_address:
+            serve(serve_address, **kwargs)
+            return
+
+        cards = [variant for path in tex for variant in (Tex(path).variants() if matrix else [Tex(path)])]
+        if check:
+            problems = False
+            for c in cards:
+                try:
+                    c.check(**kwargs)
+                except CheckError as e:
+                    print(e, file=sys.stderr)
+                    problems = True
+            if problems:
+                exit(1)
+            return
+
+        if workers:
+            builds: list[Tex] = distribute(cards, **kwargs)
+        else:
+            builds: list[Tex] = [c.build(**kwargs) for c in cards]
+        [b.wait() for b in builds]
 
         if paper:
-            [grid_pdf(b.output, b.has_back) for b in builds]
+            for b in builds:
+                with Progress(b.output.name, 'print', unit='sheets') as progress:
+                    grid_pdf(b.output, b.has_back, progress)
 
         if combine and len(builds) > 1:
             if not all([b.completed for b in builds]):
                 raise RuntimeError('Not all .tex files have succesfully compiled.')
             combine_pdf(*[b.output for b in builds])
-            builds[0].release()
-        else:
-            [b.release() for b in builds]
+            [b.discard() for b in builds[1:]]
+            builds = builds[:1]
+
+        if optimize:
+            for b in builds:
+                with Progress(b.output.name, 'optimize', unit='images') as progress:
+                    saved = optimize_pdf(b.output, b.size, optimize_dpi, progress)
+                print(f'{b.output.name}: {saved / 2 ** 20:.1f} MB saved by optimizing')
+
+        [b.release() for b in builds]
     except Exception as e:
         print(e, file=sys.stderr)
         logging.exception(e)
@@ -0,0 +1,47 @@
+import io
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Any, Iterable, Mapping
+
+import pandas as pd
+
+from . import tempdir
+from .pdf import grid_pdf, optimize_pdf
+from .tex import Tex
+
+
+def _data(rows: Iterable[Mapping[str, Any]] | pd.DataFrame) -> pd.DataFrame:
+    # the same str values as read from an .xlsx file, with '' for empty cells
+    data = rows.reset_index(drop=True).astype(object) if isinstance(rows, pd.DataFrame) else pd.DataFrame(list(rows), dtype=object)
+    return data.where(data.notna(), '').astype(str)
+
+
+def render(tex: str, rows: Iterable[Mapping[str, Any]] | pd.DataFrame = (), base_dir: Path | str = '.',
+           paper: bool = False, **kwargs) -> bytes:
+    r"""
+    Compile cards from the contents of a .tex file and its rows of data (dicts of column to value, or a DataFrame),
+    and return the PDF. Relative paths (\input, images) are resolved against base_dir, but nothing is written there;
+    all files are built in a temporary directory. Accepts the same options as the cardlatex command, e.g. draft=True.
+    """
+    with tempfile.TemporaryDirectory(dir=tempdir) as build_dir:
+        cards = Tex(Path(build_dir) / 'cardlatex.tex', content=tex, data=_data(rows), base_dir=Path(base_dir).resolve())
+        try:
+            cards.build(**kwargs).wait()
+            if paper:
+                grid_pdf(cards.output, cards.has_back)
+            if kwargs.get('optimize', False):
+                optimize_pdf(cards.output, cards.size, kwargs.get('optimize_dpi', 300))
+            return cards.output.read_bytes()
+        finally:
+            # also removes the build directory of these cards within any build_dir
+            cards.discard()
+            shutil.rmtree(cards.cache_dir, ignore_errors=True)
+
+
+def render_stream(tex: str, rows: Iterable[Mapping[str, Any]] | pd.DataFrame = (), base_dir: Path | str = '.',
+                  paper: bool = False, **kwargs) -> io.BytesIO:
+    """
+    As render(), but returns the PDF as a stream
+    """
+    return io.BytesIO(render(tex, rows, base_dir, paper, **kwargs))
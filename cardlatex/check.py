@@ -0,0 +1,104 @@
+import re
+from typing import Dict, Iterable, List, NamedTuple, Set, Tuple
+
+import pandas as pd
+
+VARIABLE = re.compile(r'<\$(\w+)\$>')
+# \includegraphics of a file named by <$variables$>
+GRAPHICS = re.compile(r'\\includegraphics\s*(?:\[[^]]*])?\{([^}]*<\$\w+\$>[^}]*)}')
+MATH = r'(?<!\\)\$(?:[^$\\]|\\.)*\$'
+UNESCAPED = r'(?<!\\)'
+
+
+class Problem(NamedTuple):
+    row: int | None  # of the data, i.e. from 0
+    column: str | None
+    message: str
+
+    def __str__(self):
+        location = ([] if self.row is None else [f'row {self.row + 1}']) + ([] if self.column is None else [f'column {self.column}'])
+        return f'{", ".join(location)}: {self.message}' if location else self.message
+
+
+class CheckError(ValueError):
+    def __init__(self, message: str, problems: List[Problem]):
+        super().__init__(message)
+        self.problems = problems
+
+
+def variables(texts: Iterable[str]) -> Tuple[Set[str], Set[str]]:
+    r"""
+    The <$variables$> of the templates which are typeset, and those which only name a file for \includegraphics
+    """
+    texts = list(texts)
+    typeset = {m.group(1) for text in texts for m in VARIABLE.finditer(GRAPHICS.sub('', text))}
+    files = {m.group(1) for text in texts for g in GRAPHICS.finditer(text) for m in VARIABLE.finditer(g.group(1))}
+    return typeset, files - typeset
+
+
+def check_variables(names: Iterable[str], columns: Iterable[str]) -> List[Problem]:
+    columns = set(columns)
+    return [Problem(None, name, f'<${name}$> is not a column of the data') for name in sorted(set(names) - columns)]
+
+
+def check_values(data: pd.DataFrame, typeset: Iterable[str], files: Iterable[str] = ()) -> List[Problem]:
+    r"""
+    Vectorized checks of the values of the typeset columns for TeX special characters which fail to compile, and of the
+    columns which only name files for unbalanced braces
+    """
+    problems = []
+    for column in [*typeset, *files]:
+        values = data[column].fillna('').astype(str).str.replace(r'\\\\', '', regex=True)
+        checks = [(values.str.count(UNESCAPED + r'\{') != values.str.count(UNESCAPED + '}'), 'unbalanced braces')]
+        if column in typeset:
+            text = values.str.replace(MATH, '', regex=True)
+            checks.extend([
+                (values.str.contains(UNESCAPED + '&'), r'unescaped &, use \&'),
+                (values.str.contains(UNESCAPED + '%'), r'unescaped %, use \%'),
+                (values.str.contains(UNESCAPED + '#'), r'unescaped #, use \#'),
+                (values.str.count(UNESCAPED + r'\$') % 2 == 1, r'unbalanced $, use \$'),
+                (text.str.contains(UNESCAPED + '_'), r'_ outside of math, use \_'),
+                (text.str.contains(UNESCAPED + r'\^'), r'^ outside of math, use \^{}'),
+            ])
+        for mask, message in checks:
+            problems.extend(Problem(row, column, message) for row in data.index[mask])
+    return sorted(problems, key=lambda p: (p.row, str(p.column)))
+
+
+def graphics(texts: Iterable[str], data: pd.DataFrame) -> Dict[str, List[Tuple[int, str]]]:
+    r"""
+    The files named by <$variables$> for \includegraphics in the templates, with the rows and columns naming each;
+    except in rows where any of these values is empty
+    """
+    paths = {}
+    for text in texts:
+        for g in GRAPHICS.finditer(text):
+            if '\\' in g.group(1):
+                continue  # named by macros as well
+            parts = VARIABLE.split(g.group(1))  # literal text and variable names, alternating
+            names = parts[1::2]
+            path = pd.Series('', index=data.index)
+            for i, part in enumerate(parts):
+                path = path + (data[part].fillna('').astype(str) if i % 2 else part)
+            filled = pd.concat([data[name].fillna('').astype(str) != '' for name in names], axis=1).all(axis=1)
+            for row, file in path[filled].items():
+                paths.setdefault(file, []).append((row, ', '.join(dict.fromkeys(names))))
+    return paths
+
+
+def escape(data: pd.DataFrame, columns: Iterable[str]) -> pd.DataFrame:
+    r"""
+    data with the TeX special characters of columns escaped: & % # always, _ ^ outside of math and $ if unbalanced
+    """
+    data = data.copy()
+    for column in columns:
+        values = data[column]
+        text = values.notna()
+        values = values.where(~text, values[text].astype(str).str.replace(UNESCAPED + r'([&%#])', r'\\\1', regex=True))
+        dollars = text & (values.astype(str).str.count(UNESCAPED + r'\$') % 2 == 1)
+        values = values.where(~dollars, values[dollars].str.replace(UNESCAPED + r'\$', r'\\$', regex=True))
+        outside = MATH + '|' + UNESCAPED + r'([_^])'
+        values = values.where(~text, values[text].str.replace(
+            outside, lambda m: m.group() if m.group(1) is None else ('\\_' if m.group(1) == '_' else r'\^{}'), regex=True))
+        data[column] = values
+    return data
@@ -125,6 +125,14 @@ class Config:
                 raise ValueError(f'Including page {i + 1} is invalid for {cardlatexprop("include")}')
         self._config['include'] = include
 
+    @property
+    def where(self) -> str | None:
+        return self._config.get('where', None)
+
+    @where.setter
+    def where(self, value: str):
+        self._config['where'] = value.strip()
+
     @property
     @required
     def front(self) -> str:
@@ -0,0 +1,175 @@
+import json
+import logging
+import os
+import queue
+import re
+import socket
+import socketserver
+import struct
+import threading
+from typing import List, Sequence, Tuple
+
+from .api import render
+from .progress import Progress
+from .tex import Tex
+
+HEADER = struct.Struct('>I')  # length of the JSON header of a message, which is followed by its payload
+OPTIONS = ['draft', 'keep_going', 'fail_fast', 'no_externalize', 'no_check']  # build options a coordinator passes to its workers
+RETRIES = 2
+
+
+class WorkerError(RuntimeError):
+    pass
+
+
+def send(sock: socket.socket, header: dict, payload: bytes = b''):
+    header = json.dumps({**header, 'size': len(payload)}).encode('utf-8')
+    sock.sendall(HEADER.pack(len(header)) + header + payload)
+
+
+def receive(sock: socket.socket) -> Tuple[dict, bytes]:
+    size, = HEADER.unpack(_read(sock, HEADER.size))
+    header = json.loads(_read(sock, size).decode('utf-8'))
+    return header, _read(sock, header['size'])
+
+
+def _read(sock: socket.socket, size: int) -> bytes:
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(min(size - len(data), 1 << 20))
+        if not chunk:
+            raise ConnectionError('connection closed')
+        data += chunk
+    return bytes(data)
+
+
+def _tcp(address: str) -> Tuple[str, int] | None:
+    # host:port, or else the path of a Unix socket
+    if m := re.match(r'^(.*):(\d+)$', address):
+        return m.group(1), int(m.group(2))
+    return None
+
+
+def connect(address: str, timeout: float) -> socket.socket:
+    if tcp := _tcp(address):
+        return socket.create_connection((tcp[0] or 'localhost', tcp[1]), timeout)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(address)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        request, _ = receive(self.request)
+        logging.info(f'{self.client_address}: rendering {len(request["rows"])} rows of {request["base_dir"]}')
+        try:
+            pdf = render(request['tex'], request['rows'], request['base_dir'], build_all=True,
+                         **{**self.server.options, **request['options']})
+        except Exception as e:
+            logging.exception(e)
+            send(self.request, {'error': str(e)})
+        else:
+            send(self.request, {}, pdf)
+
+
+def serve(address: str, **kwargs):
+    """
+    Build shards of cards for a coordinator (see distribute) at address, host:port or the path of a Unix socket,
+    until interrupted. The .tex files, and any files they refer to, must be at the same paths as for the coordinator.
+    Without a host, only local connections are accepted: a worker compiles any TeX it is sent, without authentication.
+    """
+    if tcp := _tcp(address):
+        server = socketserver.ThreadingTCPServer((tcp[0] or 'localhost', tcp[1]), _Handler, bind_and_activate=False)
+        server.allow_reuse_address = True
+        server.server_bind()
+        server.server_activate()
+    else:
+        if os.path.exists(address):
+            os.remove(address)
+        server = socketserver.ThreadingUnixStreamServer(address, _Handler)
+    server.daemon_threads = True
+    server.options = {key: value for key, value in kwargs.items() if key in OPTIONS + ['build_dir', 'artifact_cache']}
+
+    with server:
+        logging.info(f'serving at {address}')
+        print(f'cardlatex worker serving at {address}')
+        server.serve_forever()
+
+
+def request(address: str, shard: dict, timeout: float, **kwargs) -> bytes:
+    """
+    Build one shard (see Tex.shards) on the worker at address, returns its PDF
+    """
+    with connect(address, timeout) as sock:
+        send(sock, {**shard, 'options': {key: value for key, value in kwargs.items() if key in OPTIONS}})
+        header, pdf = receive(sock)
+    if 'error' in header:
+        raise WorkerError(f'{address}: {header["error"]}')
+    return pdf
+
+
+def distribute(cards: List[Tex], workers: Sequence[str], shard_size: int = 16, worker_timeout: float = 600.,
+               **kwargs) -> List[Tex]:
+    """
+    Build cards on workers (see serve) in shards of at most shard_size rows, and assemble the PDF of each from its
+    shards. A worker may be listed more than once to build as many shards at the same time. A shard whose worker
+    times out or disconnects is retried on another worker, up to RETRIES times, and that worker gets no more shards.
+    """
+    if not kwargs.get('no_check', False) and not kwargs.get('keep_going', False):
+        [card.check(**kwargs) for card in cards]
+    shards = [(i, j, shard) for i, card in enumerate(cards) for j, shard in enumerate(card.shards(shard_size, **kwargs))]
+    tasks = queue.Queue()
+    for shard in shards:
+        tasks.put((shard, 0))
+    results: dict[Tuple[int, int], bytes] = {}
+    failures: List[Exception] = []
+    alive = list(workers)
+    lock = threading.Lock()
+    done = threading.Event()
+
+    def work(address: str, progress: Progress):
+        while not done.is_set():
+            try:
+                (i, j, shard), attempts = tasks.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            try:
+                pdf = request(address, shard, worker_timeout, **kwargs)
+            except WorkerError as e:
+                failures.append(e)
+                done.set()
+            except OSError as e:
+                logging.warning(f'{address}: shard {j} of {cards[i].output.name} failed ({e}), attempt {attempts + 1}')
+                with lock:
+                    alive.remove(address)
+                    if attempts >= RETRIES or not alive:
+                        failures.append(WorkerError(f'{address}: shard {j} of {cards[i].output.name} failed, {e}'))
+                        done.set()
+                    else:
+                        tasks.put(((i, j, shard), attempts + 1))
+                return
+            else:
+                with lock:
+                    results[i, j] = pdf
+                    progress.advance()
+                    if len(results) == len(shards):
+                        done.set()
+
+    if not shards:
+        done.set()
+    with Progress('workers', 'compile', total=len(shards), unit='shards') as progress:
+        threads = [threading.Thread(target=work, args=(address, progress), daemon=True) for address in workers]
+        [t.start() for t in threads]
+        [t.join() for t in threads]
+
+    if failures:
+        raise failures[0]
+    pdfs = [[] for _ in cards]
+    for i, j, _ in shards:
+        pdfs[i].append(results[i, j])
+    return [card.assemble(pdfs[i], **kwargs) for i, card in enumerate(cards)]
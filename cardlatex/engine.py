@@ -0,0 +1,151 @@
+import logging
+import os
+import re
+import shutil
+import subprocess
+from pathlib import Path
+from typing import List, Sequence, Tuple
+
+from .progress import Progress
+
+MAX_PRINT_LINE = 79  # TeX wraps its terminal and log output at this many characters
+MAX_ERROR_LINES = 50
+
+
+def executable(name: str) -> str:
+    """
+    Resolve a TeX engine executable on PATH (on Windows, PATHEXT resolves 'xelatex' to 'xelatex.exe')
+    """
+    path = shutil.which(name)
+    if path is None:
+        raise FileNotFoundError(f'{name} not found, ensure a TeX distribution (e.g. MiKTeX) is installed and on your PATH')
+    return path
+
+
+class Log:
+    """
+    Parses XeLaTeX output line by line, keeping only errors, missing files, the cardlatex graphicspaths and
+    the number of pages shipped out
+    """
+
+    def __init__(self):
+        self.errors: List[Tuple[str, int | None]] = []
+        self.missing: set[str] = set()
+        self.graphicspaths: str | None = None
+        self.pages = 0
+        self.aborted = False
+
+        self._wrapped = ''
+        self._previous = ''
+        self._error: List[str] | None = None
+        self._error_line: int | None = None
+
+    def _close_error(self):
+        if self._error is not None:
+            if self._error_line is None:
+                self.errors.append((self._error[0], None))
+            else:
+                self.errors.append(('\n'.join(self._error), self._error_line))
+            self._error, self._error_line = None, None
+
+    def _parse(self, line: str):
+        if line.startswith('! '):
+            self._close_error()
+            self._error = [line]
+        elif self._error is not None:
+            if self._error_line is not None and not line.strip():
+                self._close_error()
+            elif len(self._error) < MAX_ERROR_LINES:
+                self._error.append(line)
+                if self._error_line is None and (m := re.match(r'l\.(\d+)', line)):
+                    self._error_line = int(m.group(1))
+
+        for pattern in [r'! LaTeX Error: File `(.+)\' not found', r'LaTeX Warning: File `(.+)\' not found']:
+            if m := re.search(pattern, line):
+                self.missing.add(m.group(1))
+
+        # [n] is written as page n is shipped out
+        for m in re.finditer(r'\[(\d+)(?=[]\s{<]|$)', line):
+            self.pages = max(self.pages, int(m.group(1)))
+
+        if self._previous == 'cardlatex@graphicpaths':
+            self.graphicspaths = line
+        self._previous = line
+
+    def feed(self, line: str) -> bool:
+        """
+        Parse one line of output, returns whether it completed an error
+        """
+        errors = len(self.errors)
+        line = line.rstrip('\r\n')
+        # rejoin lines wrapped by TeX, so that long file names are matched in full
+        if len(line) == MAX_PRINT_LINE:
+            self._wrapped += line
+            return False
+        line, self._wrapped = self._wrapped + line, ''
+        self._parse(line)
+        return len(self.errors) > errors
+
+    def close(self):
+        if self._wrapped:
+            self._parse(self._wrapped)
+            self._wrapped = ''
+        self._close_error()
+
+
+def environment(inputs: Sequence[Path] = ()) -> dict[str, str]:
+    r"""
+    Environment in which TeX also searches the inputs directories for files (e.g. \input, images), and which dates
+    its output at SOURCE_DATE_EPOCH (1970-01-01 unless set) so that the same input gives the same PDF
+    """
+    env = os.environ.copy()
+    env.setdefault('SOURCE_DATE_EPOCH', '0')
+    if inputs:
+        # the trailing separator keeps the default search path
+        env['TEXINPUTS'] = os.pathsep.join([Path(path).resolve().as_posix() for path in inputs] + [env.get('TEXINPUTS', '')])
+    return env
+
+
+def xelatex(tex_path: Path, fail_fast: bool = False, progress: Progress | None = None, inputs: Sequence[Path] = ()) -> Log:
+    """
+    Run XeLaTeX with -no-pdf on tex_path, writing only the .log and .xdv files next to it.
+    Its output is parsed while it runs; with fail_fast, XeLaTeX is killed at the first error.
+    """
+    for suffix in ['.pdf', '.xdv']:
+        if (path := tex_path.with_suffix(suffix)).exists():
+            os.remove(path)
+
+    args = [executable('xelatex'), '-interaction=nonstopmode', '-no-pdf', tex_path.name]
+    logging.info(f'{tex_path}: running {args}')
+    log = Log()
+    with subprocess.Popen(args, cwd=tex_path.parent, env=environment(inputs), stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                          encoding='utf-8', errors='replace') as process:
+        for line in process.stdout:
+            error = log.feed(line)
+            if progress and log.pages != progress.done:
+                progress.update(log.pages)
+            if error and fail_fast:
+                logging.info(f'{tex_path}: aborting XeLaTeX at the first error')
+                log.aborted = True
+                process.kill()
+                break
+    log.close()
+    if progress:
+        progress.update(log.pages)
+    return log
+
+
+def xdvipdfmx(xdv_path: Path, inputs: Sequence[Path] = ()) -> subprocess.Popen:
+    """
+    Start converting xdv_path to a .pdf in the background, see wait_xdvipdfmx
+    """
+    args = [executable('xdvipdfmx'), '-q', '-o', xdv_path.with_suffix('.pdf').name, xdv_path.name]
+    logging.info(f'{xdv_path}: running {args}')
+    return subprocess.Popen(args, cwd=xdv_path.parent, env=environment(inputs), stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+
+def wait_xdvipdfmx(process: subprocess.Popen):
+    _, stderr = process.communicate()
+    if process.returncode != 0:
+        stderr = stderr.decode('utf-8', errors='replace').strip()
+        raise subprocess.SubprocessError(f'xdvipdfmx failed with exit code {process.returncode}\n{stderr}')
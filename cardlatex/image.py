@@ -12,6 +12,22 @@ suffixes = '.pdf,.ai,.png,.jpg,.jpeg,.jp2,.jpf,.bmp,.ps,.eps,.mps'.split(',')
 DRAFT_TARGET_SIZE = 51200  # in bytes
 
 
+def find_file(file: str, *directories: Path) -> Path:
+    r"""
+    Find a graphics file as \includegraphics would, trying each of the graphics suffixes if it has none
+    """
+    for directory in directories:
+        path = directory / file
+        if path.suffix:
+            if path.exists():
+                return path
+        else:
+            for suffix in suffixes:
+                if path.with_suffix(suffix).exists():
+                    return path.with_suffix(suffix)
+    raise FileNotFoundError(f'{file} not found in any directory: {directories}')
+
+
 class Image:
     def __init__(self, tex_dir: Path, cache_dir: Path):
         self._tex_dir = tex_dir
@@ -25,17 +41,7 @@ class Image:
             self._cache_path = self._cache_dir / self._tex_path.relative_to(self._tex_dir)
 
     def find_source_from_directories(self, file: str, *directories: Path):
-        if directories:
-            for directory in directories:
-                path = directory / file
-                if path.suffix:
-                    if path.exists():
-                        return self._set_source_from_path(path)
-                else:
-                    for suffix in suffixes:
-                        if path.with_suffix(suffix).exists():
-                            return self._set_source_from_path(path.with_suffix(suffix))
-        raise FileNotFoundError(f'{file} not found in any directory: {directories}')
+        self._set_source_from_path(find_file(file, *directories))
 
     def find_source_from_cache(self, file: Path):
         file_info = file.with_suffix('')
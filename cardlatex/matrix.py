@@ -0,0 +1,74 @@
+import itertools
+import re
+from typing import Dict, List, Tuple
+
+import pandas as pd
+
+SHEET = 'cardlatex'
+# <column>@<dimension>=<value>[,<dimension>=<value>...], e.g. title@lang=en or cardlatex@lang=en,finish=gloss
+VARIANT = re.compile(r'^(.+)@(\w+=[^,=@]+(?:,\w+=[^,=@]+)*)$')
+
+
+def parse_variant(name: str) -> Tuple[str, Dict[str, str]] | None:
+    """
+    Split a column or sheet name into its base name and the variant it applies to
+    """
+    if m := VARIANT.match(str(name)):
+        return m.group(1), dict(pair.split('=') for pair in m.group(2).split(','))
+    return None
+
+
+def dimensions(sheets: Dict[str, pd.DataFrame]) -> Dict[str, List[str]]:
+    """
+    Every dimension and its values, in order of appearance, from the variant columns of the cardlatex sheet and the
+    variant sheets
+    """
+    dims = {}
+    for name in [*sheets[SHEET].columns, *sheets]:
+        if (variant := parse_variant(name)) and (name not in sheets or variant[0] == SHEET):
+            for dim, value in variant[1].items():
+                values = dims.setdefault(dim, [])
+                if value not in values:
+                    values.append(value)
+    return dims
+
+
+def provided(sheets: Dict[str, pd.DataFrame]) -> set:
+    """
+    Names of <$variables$> which the variants provide, besides the columns of the cardlatex sheet
+    """
+    names = set(dimensions(sheets))
+    names.update(variant[0] for variant in map(parse_variant, sheets[SHEET].columns) if variant)
+    for name, sheet in sheets.items():
+        if (variant := parse_variant(name)) and variant[0] == SHEET:
+            names.update(sheet.columns)
+    return names
+
+
+def variants(sheets: Dict[str, pd.DataFrame]) -> Dict[str, pd.DataFrame]:
+    """
+    The data of every combination of the dimensions, by variant name (its values joined by '.'). Each variant takes
+    the cardlatex sheet, then replaces its columns by those of the matching variant sheets and variant columns, from
+    the least to the most specific, and adds a column for each dimension with its value.
+    """
+    data = sheets[SHEET]
+    dims = dimensions(sheets)
+    overrides = [(variant[1], sheet) for name, sheet in sheets.items()
+                 if (variant := parse_variant(name)) and variant[0] == SHEET]
+    overrides.extend((variant[1], data[[column]].set_axis([variant[0]], axis=1))
+                     for column in data.columns if (variant := parse_variant(column)))
+
+    frames = {}
+    for values in itertools.product(*dims.values()):
+        combination = dict(zip(dims, values))
+        frame = data[[column for column in data.columns if not parse_variant(column)]].copy()
+        for pairs, override in sorted(overrides, key=lambda o: len(o[0])):
+            if pairs.items() <= combination.items():
+                override = override.reindex(frame.index, fill_value='')
+                for column in override.columns:
+                    frame[column] = override[column]
+        for dim, value in combination.items():
+            if dim not in frame:
+                frame[dim] = value
+        frames['.'.join(values)] = frame
+    return frames
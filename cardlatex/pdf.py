@@ -1,9 +1,16 @@
+import hashlib
+import io
 import math
+import re
+import zlib
 from decimal import Decimal
 from pathlib import Path
-from typing import List
+from typing import Dict, List, Tuple
 
-from pikepdf import Pdf, Page, Rectangle
+from pikepdf import Array, Dictionary, Name, Object, ObjectStreamMode, Pdf, PdfImage, Page, Rectangle, Stream
+from pikepdf.models.image import UnsupportedImageTypeError
+
+from .progress import Progress
 
 
 def unit_to_cm(unit: Decimal):
@@ -14,6 +21,14 @@ def cm_to_unit(cm: float):
     return Decimal((cm / 2.54) * 72)
 
 
+def length_to_cm(length: str) -> float:
+    r"""
+    A \cardlatex length (e.g. 6.3cm, 63mm or 2.5in) in cm; as in TikZ, a length without unit is in cm
+    """
+    value, unit = re.match(r'^(\d+(?:\.\d+)?)(cm|mm|in)?$', length.strip()).groups()
+    return float(value) * {'mm': 0.1, 'in': 2.54}.get(unit, 1)
+
+
 A4 = Rectangle(0, 0, cm_to_unit(21), cm_to_unit(29.7))
 A3 = Rectangle(0, 0, cm_to_unit(29.7), cm_to_unit(42))
 
@@ -29,19 +44,83 @@ def find_crop(paper_sz, box_sz):
 
 
 def combine_pdf(*files: Path) -> Path:
+    """
+    Combine the pages of files into the first; XObjects (e.g. images) with the same contents in several files, such
+    as the art shared by the cards of a deck built in parts, are stored once
+    """
     pdfs = [Pdf.open(file) for file in files]
     pdf_output = Pdf.new()
 
     for pdf in pdfs:
         for page in pdf.pages:
             pdf_output.pages.append(page)
+
+    streams, digests = {}, {}
+    for page in pdf_output.pages:
+        _dedupe(page.obj.get(Name.Resources), streams, digests)
+    for pdf in pdfs:
         pdf.close()
 
-    pdf_output.save(files[0])
+    pdf_output.save(files[0], deterministic_id=True)
     return files[0]
 
 
-def grid_pdf(file: Path, has_back: bool = False):
+def _dedupe(resources: Dictionary | None, streams: Dict[bytes, Stream], digests: Dict[Tuple[int, int], bytes]):
+    # replace the XObjects of resources, and of the forms among them, by the first XObject with the same contents
+    if resources is None or Name.XObject not in resources:
+        return
+    xobjects = resources.XObject
+    for name, xobject in list(xobjects.items()):
+        if isinstance(xobject, Stream):
+            if xobject.objgen not in digests:
+                _dedupe(xobject.get(Name.Resources), streams, digests)
+            xobjects[name] = streams.setdefault(_digest(xobject, digests), xobject)
+
+
+def _digest(obj, digests: Dict[Tuple[int, int], bytes]) -> bytes:
+    # of the contents of obj and the objects it refers to, whichever objects of the PDF hold them
+    indirect = isinstance(obj, Object) and obj.is_indirect
+    if indirect:
+        if obj.objgen in digests:
+            return digests[obj.objgen]
+        digests[obj.objgen] = repr(obj.objgen).encode()  # in case of a cycle
+    sha = hashlib.sha1()
+    if isinstance(obj, (Dictionary, Stream)):
+        for key, value in sorted(obj.items()):
+            if key != '/Length':
+                sha.update(key.encode() + _digest(value, digests))
+        if isinstance(obj, Stream):
+            sha.update(obj.read_raw_bytes())
+    elif isinstance(obj, Array):
+        for item in obj:
+            sha.update(_digest(item, digests))
+    else:
+        sha.update(obj.unparse() if isinstance(obj, Object) else repr(obj).encode())
+    digest = sha.digest()
+    if indirect:
+        digests[obj.objgen] = digest
+    return digest
+
+
+def split_pdf(file: Path, *pages: int) -> List[Path]:
+    """
+    Split file into consecutive files of the given numbers of pages, named <file>.<i>.pdf
+    """
+    files = []
+    with Pdf.open(file) as pdf:
+        if len(pdf.pages) != sum(pages):
+            raise ValueError(f'{file} has {len(pdf.pages)} pages, not {sum(pages)}')
+        start = 0
+        for i, n in enumerate(pages):
+            part = Pdf.new()
+            part.pages.extend(pdf.pages[start:start + n])
+            part.save(path := file.with_suffix(f'.{i}.pdf'), deterministic_id=True)
+            files.append(path)
+            start += n
+    return files
+
+
+def grid_pdf(file: Path, has_back: bool = False, progress: Progress | None = None):
     if not file.exists():
         raise FileNotFoundError(f'input pdf not found: {file}')
 
@@ -83,6 +162,8 @@ def grid_pdf(file: Path, has_back: bool = False):
     rect_height = box.height - y_crop * 2
     x_offset = rect_width * (paper.width / rect_width - x_max) / 2
     y_offset = rect_height * (paper.height / rect_height - y_max) / 2
+    if progress:
+        progress.total = len(sheets)
     for sheet in sheets:
         x, y = x_offset, y_offset
         new_page = pdf_output.add_blank_page(page_size=(paper.width, paper.height))
@@ -93,6 +174,61 @@ def grid_pdf(file: Path, has_back: bool = False):
             if i % x_max == 0:
                 x = x_offset
                 y += rect_height
+        if progress:
+            progress.advance()
 
     pdf.close()
-    pdf_output.save(file)
+    pdf_output.save(file, deterministic_id=True)
+
+
+def optimize_pdf(file: Path, size: Tuple[float, float], dpi: int = 300, progress: Progress | None = None) -> int:
+    """
+    Downsample the images in file to at most dpi when drawn across a card of size (width, height in cm), recompress
+    its streams and generate object streams. Returns the number of bytes saved.
+    """
+    if not file.exists():
+        raise FileNotFoundError(f'input pdf not found: {file}')
+
+    before = file.stat().st_size
+    max_width, max_height = (math.ceil(cm / 2.54 * dpi) for cm in size)
+    with Pdf.open(file, allow_overwriting_input=True) as pdf:
+        images = [obj for obj in pdf.objects if isinstance(obj, Stream) and obj.get('/Subtype') == Name.Image]
+        if progress:
+            progress.total = len(images)
+        for image in images:
+            _downsample(image, max_width, max_height)
+            if progress:
+                progress.advance()
+        pdf.save(compress_streams=True, recompress_flate=True, object_stream_mode=ObjectStreamMode.generate,
+                 deterministic_id=True)
+    return before - file.stat().st_size
+
+
+def _downsample(image: Stream, max_width: int, max_height: int):
+    # an image is never drawn larger than a card, whichever way it is rotated
+    width, height = int(image.Width), int(image.Height)
+    scale = min(1., max(max_width / width, max_height / height))
+    if scale == 1. or image.get('/ImageMask', False) or '/Decode' in image:
+        return
+
+    try:
+        pil = PdfImage(image).as_pil_image()
+    except (UnsupportedImageTypeError, NotImplementedError):
+        return
+    if pil.mode not in ['L', 'RGB', 'CMYK']:
+        return
+
+    pil = pil.resize((max(round(width * scale), 1), max(round(height * scale), 1)))
+    if image.get('/Filter') == Name.DCTDecode and pil.mode != 'CMYK':
+        with io.BytesIO() as jpeg:
+            pil.save(jpeg, 'JPEG', quality=90)
+            data, encoding = jpeg.getvalue(), Name.DCTDecode
+    else:
+        data, encoding = zlib.compress(pil.tobytes()), Name.FlateDecode
+    if len(data) >= len(image.read_raw_bytes()):
+        return
+
+    image.write(data, filter=encoding)
+    image.Width, image.Height, image.BitsPerComponent = pil.width, pil.height, 8
+    if '/DecodeParms' in image:
+        del image.DecodeParms
@@ -0,0 +1,71 @@
+import json
+import sys
+import time
+from datetime import timedelta
+from typing import TextIO
+
+TTY_INTERVAL = 0.1  # in seconds
+JSON_INTERVAL = 1.0  # in seconds
+
+
+class Progress:
+    """
+    Reports progress of one stage of a deck; rewriting a single line on a TTY, or else as JSON events, one per line
+    """
+
+    def __init__(self, deck: str, stage: str, total: int | None = None, unit: str = 'cards', stream: TextIO | None = None):
+        self.deck = deck
+        self.stage = stage
+        self.total = total
+        self.unit = unit
+        self.done = 0
+
+        self._stream = sys.stderr if stream is None else stream
+        self._tty = self._stream.isatty()
+        self._start = time.monotonic()
+        self._reported = 0.
+
+    def __enter__(self) -> 'Progress':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def rate(self) -> float:
+        elapsed = time.monotonic() - self._start
+        return self.done / elapsed if elapsed > 0 else 0.
+
+    @property
+    def eta(self) -> float | None:
+        if self.total is None or self.rate == 0:
+            return None
+        return max(self.total - self.done, 0) / self.rate
+
+    def update(self, done: int):
+        self.done = done
+        now = time.monotonic()
+        if now - self._reported >= (TTY_INTERVAL if self._tty else JSON_INTERVAL):
+            self._reported = now
+            self._report()
+
+    def advance(self, n: int = 1):
+        self.update(self.done + n)
+
+    def close(self):
+        if self.done:
+            self._report(closing=True)
+
+    def _report(self, closing: bool = False):
+        eta = self.eta
+        if self._tty:
+            total = '' if self.total is None else f'/{self.total}'
+            eta = '' if eta is None or closing else f', ETA {timedelta(seconds=round(eta))}'
+            line = f'{self.deck} {self.stage}: {self.done}{total} {self.unit}, {self.rate:.1f} {self.unit}/s{eta}'
+            self._stream.write(f'\r{line}\033[K' + ('\n' if closing else ''))
+        else:
+            self._stream.write(json.dumps({'event': 'done' if closing else 'progress', 'deck': self.deck, 'stage': self.stage,
+                                           'unit': self.unit, 'done': self.done, 'total': self.total,
+                                           'rate': round(self.rate, 3), 'eta': None if eta is None else round(eta, 1),
+                                           'elapsed': round(time.monotonic() - self._start, 3)}) + '\n')
+        self._stream.flush()
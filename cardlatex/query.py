@@ -0,0 +1,38 @@
+import re
+from typing import List
+
+import pandas as pd
+
+
+def numeric(data: pd.DataFrame) -> pd.DataFrame:
+    """
+    data with each column of which every non-empty value is a number converted to numbers, with NaN for empty values,
+    and the empty values of other columns as ''
+    """
+    frame = data.copy()
+    for column in frame.columns:
+        values = frame[column]
+        empty = values.isna() | (values.astype(str).str.strip() == '')
+        numbers = pd.to_numeric(values.where(~empty), errors='coerce')
+        if numbers.notna().sum() == (~empty).sum() and (~empty).any():
+            frame[column] = numbers
+        else:
+            frame[column] = values.where(~empty, '')
+    return frame
+
+
+def where(data: pd.DataFrame, expression: str) -> List[int]:
+    """
+    Rows of data for which expression is true, e.g. type == "spell" and cost > 3; evaluated over all rows at once by
+    pandas, see DataFrame.eval. Use `backticks` for column names which are not identifiers.
+    """
+    # an expression may span lines, e.g. in \cardlatex[where]; spaces within string literals are kept
+    expression = re.sub(r'\s*\n\s*', ' ', expression.strip())
+    try:
+        selected = numeric(data).eval(expression, engine='python')
+    except Exception as e:
+        raise ValueError(f'invalid where expression "{expression}": {e}')
+    if not isinstance(selected, pd.Series) or not pd.api.types.is_bool_dtype(selected):
+        raise ValueError(f'invalid where expression "{expression}": not a condition on each row')
+    # missing values (e.g. of a comparison with an empty string cell) are not selected
+    return list(selected.index[selected.fillna(False).astype(bool)])
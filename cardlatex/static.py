@@ -0,0 +1,91 @@
+import re
+from typing import List, Tuple
+
+# top-level TikZ statements which only draw, and so may be typeset once and included as an image
+DRAWING = re.compile(r'\\(node|draw|fill|filldraw|shade|shadedraw|path|pic)\b|\\begin\{(scope|background)}|\\begin\{pgfonlayer}\{background}')
+# statements which affect everything drawn after them; clipping is only contained within an environment
+SIDE_EFFECTS = re.compile(r'\\begin\{foreground}|\\begin\{pgfonlayer}\{(?!background})|\\(def|gdef|let|newcommand|renewcommand|tikzset|pgfkeys|tikzmath)\b')
+PATH_EFFECTS = re.compile(r'clip|bounding box')
+NAMES = re.compile(r'\\(?:node|coordinate|pic)\s*(?:\[[^\]]*])?\s*\((\w+)\)|name(?: path)?\s*=\s*\{?(\w+)')
+BACKGROUND = re.compile(r'\\begin\{background}|\\begin\{pgfonlayer}\{background}')
+
+
+def statements(text: str) -> List[str]:
+    r"""
+    Split TikZ code into its top-level statements, each ending with a ';' or with the \end{...} of an environment
+    """
+    parts = []
+    start, braces, envs, i = 0, 0, 0, 0
+    while i < len(text):
+        c = text[i]
+        if c == '%':
+            i = text.find('\n', i)
+            if i < 0:
+                break
+        elif c == '\\':
+            if text.startswith('\\begin{', i):
+                envs += 1
+            elif text.startswith('\\end{', i):
+                envs -= 1
+                i = text.find('}', i)
+                if i < 0:
+                    break
+                if envs == 0 and braces == 0:
+                    parts.append(text[start:i + 1])
+                    start = i + 1
+            else:
+                i += 1
+        elif c == '{':
+            braces += 1
+        elif c == '}':
+            braces -= 1
+        elif c == ';' and braces == 0 and envs == 0:
+            parts.append(text[start:i + 1])
+            start = i + 1
+        i += 1
+    parts.append(text[start:])
+    return parts
+
+
+def _code(statement: str) -> str:
+    # statement without comments and surrounding whitespace
+    return re.sub(r'(?<!\\)%.*', '', statement).strip()
+
+
+def split_static(text: str) -> Tuple[str, str, str]:
+    r"""
+    Split a front or back template into the longest prefix without <$variables$>, which only draws, and the
+    remaining dynamic part. Returns (static, dynamic, layer), where layer is the pgf layer on which the
+    typeset static part keeps the same stacking order relative to the dynamic part.
+    """
+    parts = statements(text)
+
+    n = 0
+    while n < len(parts):
+        code = _code(parts[n])
+        effects = SIDE_EFFECTS.search(code) or (not code.startswith('\\begin') and PATH_EFFECTS.search(code))
+        if code and ('<$' in parts[n] or not DRAWING.match(code) or effects):
+            break
+        n += 1
+
+    # names defined in the static part (nodes, coordinates, paths) must not be referenced by the dynamic part
+    while n > 0:
+        dynamic = ''.join(parts[n:])
+        for m in range(n):
+            names = [name for match in NAMES.finditer(parts[m]) for name in match.groups() if name]
+            if any(re.search(r'\b' + name + r'\b', dynamic) for name in names):
+                n = m
+                break
+        else:
+            break
+
+    # anything the dynamic part draws on the background layer must stay beneath the static part
+    layer = 'background'
+    if BACKGROUND.search(''.join(parts[n:])):
+        layer = 'main'
+        n = next((m for m in range(n) if BACKGROUND.search(parts[m])), n)
+
+    static, dynamic = ''.join(parts[:n]), ''.join(parts[n:])
+    if not _code(static):
+        return '', text, layer
+    return static, dynamic, layer
@@ -0,0 +1,98 @@
+import hashlib
+import os
+import shutil
+import tempfile
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Dict, Type
+
+ENVIRON = 'CARDLATEX_ARTIFACT_CACHE'
+
+
+class Store(ABC):
+    """
+    Shared storage of build artifacts (PDF files) by key, e.g. across machines or CI jobs
+    """
+
+    @abstractmethod
+    def get(self, key: str, path: Path) -> bool:
+        """
+        Write the artifact of key to path, returns whether it was found
+        """
+
+    @abstractmethod
+    def put(self, key: str, path: Path):
+        """
+        Store the file at path as the artifact of key
+        """
+
+
+class DirectoryStore(Store):
+    """
+    Artifacts as files in a directory, e.g. on a volume shared by several machines
+    """
+
+    def __init__(self, directory: Path | str):
+        self.directory = Path(directory)
+        self.directory.mkdir(exist_ok=True, parents=True)
+
+    def _path(self, key: str) -> Path:
+        # spread over subdirectories, as some file systems slow down with many files in one directory
+        return self.directory / key[:2] / key
+
+    def get(self, key: str, path: Path) -> bool:
+        try:
+            shutil.copyfile(self._path(key), path)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def put(self, key: str, path: Path):
+        artifact = self._path(key)
+        artifact.parent.mkdir(exist_ok=True)
+        # written under a temporary name first, so that no other process reads a partial artifact
+        fd, temp = tempfile.mkstemp(dir=artifact.parent, prefix='.', suffix='.tmp')
+        os.close(fd)
+        try:
+            shutil.copyfile(path, temp)
+            os.replace(temp, artifact)
+        finally:
+            if os.path.exists(temp):
+                os.remove(temp)
+
+
+# scheme://location of each Store, or else a path for a DirectoryStore; add a Store here to support its scheme
+stores: Dict[str, Type[Store]] = {'file': DirectoryStore}
+
+
+def open_store(location: str | None = None) -> Store | None:
+    """
+    The Store at location, or else at the CARDLATEX_ARTIFACT_CACHE environment variable, if any
+    """
+    location = location or os.environ.get(ENVIRON, None)
+    if not location:
+        return None
+    scheme, _, path = location.partition('://')
+    if not path:
+        return DirectoryStore(location)
+    if scheme not in stores:
+        raise ValueError(f'unknown artifact cache "{location}", expected a directory or one of {[*stores]}://')
+    return stores[scheme](path)
+
+
+_hashes: Dict[tuple, str] = {}
+
+
+def file_hash(path: Path) -> str:
+    """
+    Hash of the contents of the file at path, computed again only once it is modified
+    """
+    stat = path.stat()
+    key = (path.resolve().as_posix(), stat.st_size, stat.st_mtime_ns)
+    if key not in _hashes:
+        obj = hashlib.sha1()
+        with open(path, 'rb') as f:
+            while chunk := f.read(1 << 20):
+                obj.update(chunk)
+        _hashes[key] = obj.hexdigest()
+    return _hashes[key]
@@ -1,17 +1,29 @@
+import copy
 import hashlib
+import json
 import logging
 import os
 import re
 import shutil
 import subprocess
+import sys
 from pathlib import Path
+from typing import Iterable, List, Tuple
 
 import numpy as np
 import pandas as pd
 
-from . import tempdir
+from . import tempdir, version
+from .check import CheckError, Problem, check_values, check_variables, escape, graphics, variables
 from .config import Config
-from .image import Image, is_relative
+from .engine import Log, xelatex, xdvipdfmx, wait_xdvipdfmx
+from .image import Image, find_file, is_relative
+from .matrix import SHEET, provided, variants
+from .pdf import combine_pdf, length_to_cm, split_pdf
+from .progress import Progress
+from .query import where
+from .static import split_static
+from .store import Store, file_hash, open_store
 from .template import template as template_tex
 
 
@@ -47,20 +59,96 @@ def prepare_inputs(tex: str, tex_dir: Path):
     return tex
 
 
+FICLONE = 0x40049409  # from linux/fs.h
+
+
+def reflink(src: Path, dst: Path) -> bool:
+    """
+    Clone src to dst without copying its data, on file systems which support it (e.g. Btrfs, XFS)
+    """
+    try:
+        import fcntl
+        with open(src, 'rb') as f_src, open(dst, 'wb') as f_dst:
+            fcntl.ioctl(f_dst.fileno(), FICLONE, f_src.fileno())
+        return True
+    except (ImportError, OSError):
+        if dst.exists():
+            os.remove(dst)
+        return False
+
+
+def transfer(src: Path, dst: Path):
+    """
+    Move src to dst; by renaming it, else by cloning it, and only copying it across file systems without clones
+    """
+    if src.resolve() == dst.resolve():
+        return
+    try:
+        os.replace(src, dst)
+        return
+    except OSError:
+        pass  # e.g. across file systems
+    if dst.exists():
+        os.remove(dst)
+    if not reflink(src, dst):
+        shutil.copyfile(src, dst)
+    os.remove(src)
+
+
+# drawn in place of the static part of a template, see build()
+static_node = r'\node[anchor=center,inner sep=0pt,outer sep=0pt] at (C) {\includegraphics{<$path$>}};'
+
+# drawn in place of rows which failed to compile with build(keep_going=True)
+placeholder = r'\node[anchor=center,align=center,text width=\cardx] at (C) {\textbf{row <$row$>}\\failed to compile};'
+
+
+class CompilationError(subprocess.SubprocessError):
+    """
+    XeLaTeX compilation error(s), attributed to data rows by the % ROW markers where possible
+    """
+
+    def __init__(self, message: str, rows: dict[int, List[str]], unattributed: List[str]):
+        super().__init__(message)
+        self.rows = rows
+        self.unattributed = unattributed
+
+
 class Tex:
-    def __init__(self, tex: Path | str):
+    def __init__(self, tex: Path | str, content: str | None = None, data: pd.DataFrame | None = None,
+                 base_dir: Path | str | None = None):
+        r"""
+        Cards of the .tex file at tex and the .xlsx file next to it; or else of the given content and data, in which case
+        nothing is read from or written to tex. Relative paths (\input, images) are resolved against base_dir.
+        """
         self._path = Path(tex)
+        self._dir = self._path.parent if base_dir is None else Path(base_dir)
         self._template = self.template()
 
-        with open(self._path, 'r') as f:
-            self._tex = f.read()
+        if content is None:
+            with open(self._path, 'r') as f:
+                self._tex = f.read()
+        else:
+            self._tex = content
+        self._data = data
+        self._sheets: dict[str, pd.DataFrame] = {}
+        self._columns: List[str] = []  # of the data as given, before any columns are added for <$variables$>
+        self._xlsx: pd.DataFrame | None = None  # the cardlatex worksheet to write, see self._write_xlsx()
 
         self._config = Config(self._tex)
         self._variables = sorted(
             list(({r.group(1) for r in re.finditer(r'<\$(\w+)\$>', self._config.front + self._config.back)})))
         self._cache_dir = self.get_cache_dir(self._path)
-        self._cache_output_pdf = (self.cache_dir / self._path.name).with_suffix('.pdf')
+        self._build_dir = self.cache_dir
+        self._build_tex = self.cache_dir / self._path.name
         self._completed = False
+        self._static: dict[int, tuple[str, str, str, Path]] = {}
+        self._xdvipdfmx: subprocess.Popen | None = None
+        self._store: Store | None = None
+        self._key: str | None = None
+        self._keys: dict[int, str] = {}  # artifact key and number of pages of each row
+        self._pages: dict[int, int] = {}
+        self._order: List[int] = []
+        self._artifacts: dict[int, Path] = {}  # PDF file of each row pulled from the artifact store
 
     @staticmethod
     def template() -> str:
@@ -83,25 +171,60 @@ class Tex:
     def has_back(self) -> bool:
         return 'back' in self._config
 
+    @property
+    def size(self) -> Tuple[float, float]:
+        """
+        Width and height of a card in cm, including its bleed; as drawn by tikzcard, i.e. width - bleed with bleed on
+        either side
+        """
+        bleed = length_to_cm(self._config.bleed)
+        return length_to_cm(self._config.width) + bleed, length_to_cm(self._config.height) + bleed
+
     @property
     def output(self) -> Path:
-        return self._cache_output_pdf
+        return self._build_tex.with_suffix('.pdf')
+
+    def _get_build_dir(self, **kwargs) -> Path:
+        """
+        Directory in which XeLaTeX runs and its output files remain until self.release(); build_dir if given,
+        else cache_dir for a draft (which holds its resampled images) or next to the .tex file
+        """
+        if build_dir := kwargs.get('build_dir', None):
+            return Path(build_dir) / self.get_cache_dir(self._path).name
+        return self.cache_dir if kwargs.get('draft', False) else self._path.parent
+
+    def _get_build_tex(self, build_dir: Path) -> Path:
+        path_tex = self._path.with_suffix('.cardlatex.tex')
+        return path_tex if build_dir == path_tex.parent else build_dir / self._path.name
 
     @property
     def completed(self) -> bool:
         return self._completed
 
-    def _load_or_generate_xlsx(self):
+    def _load_or_generate_xlsx(self, write: bool = True):
+        """
+        The data of these cards, with a column for every <$variable$>; the .xlsx file is written with these columns
+        (see self._write_xlsx) only if write
+        """
         if self._variables:
             path_xlsx = self._path.with_suffix('.xlsx')
-            if path_xlsx.exists():
-                try:
-                    data_existing = pd.read_excel(path_xlsx, sheet_name='cardlatex', dtype=str, na_filter=False)
-                except ValueError as e:
-                    raise ValueError(f'{e}, ensure your .xlsx file contains a worksheet named \'cardlatex\'')
-
+            if self._data is not None:
+                self._columns = list(self._data.columns)
                 data_columns = pd.Index(
-                    [*data_existing.columns] + [c for c in self._variables if c not in data_existing])
+                    [*self._data.columns] + [c for c in self._variables if c not in self._data])
+                data_existing = self._data.reindex(columns=data_columns)
+            elif path_xlsx.exists():
+                sheets = pd.read_excel(path_xlsx, sheet_name=None, dtype=str, na_filter=False)
+                if SHEET not in sheets:
+                    raise ValueError(f'Worksheet named \'{SHEET}\' not found, '
+                                     f'ensure your .xlsx file contains a worksheet named \'{SHEET}\'')
+                self._sheets = sheets
+                data_existing = sheets[SHEET]
+                self._columns = [*data_existing.columns, *provided(sheets)]
+
+                # variables given only by variant sheets or columns are not added to the cardlatex worksheet
+                data_columns = pd.Index(
+                    [*data_existing.columns] + [c for c in self._variables if c not in data_existing and c not in provided(sheets)])
                 data_existing = data_existing.reindex(columns=data_columns)
             else:
                 data_columns = pd.Index([*sorted(self._variables)])
@@ -114,41 +237,158 @@ class Tex:
                     rows_extra = pd.DataFrame(np.nan, columns=data_existing.columns, index=range(rows, rows_expected))
                     data_existing = pd.concat([data_existing, rows_extra])
 
-            try:
-                pd.DataFrame(data_existing).to_excel(path_xlsx, index=False, sheet_name='cardlatex')
-            except PermissionError:
-                pass
+            if self._data is None:
+                self._xlsx = data_existing
+                if write:
+                    self._write_xlsx()
 
-            return data_existing
+            return data_existing.reindex(columns=[*data_existing.columns] + [c for c in self._variables if c not in data_existing])
         else:
             return pd.DataFrame()
 
-    def _prepare_tex(self, data: pd.DataFrame, **kwargs):
+    def _write_xlsx(self):
+        # the cardlatex worksheet as loaded, with its added columns and rows, and the other worksheets as they were
+        if self._xlsx is None:
+            return
+        self._sheets[SHEET], self._xlsx = self._xlsx, None
+        try:
+            with pd.ExcelWriter(self._path.with_suffix('.xlsx')) as writer:
+                for name, sheet in self._sheets.items():
+                    pd.DataFrame(sheet).to_excel(writer, index=False, sheet_name=name)
+        except PermissionError:
+            pass
+
+    def _load_data(self, write: bool = True, **kwargs) -> pd.DataFrame:
+        data = self._load_or_generate_xlsx(write)
+        if kwargs.get('escape', False):
+            data = escape(data, variables(self._texts())[0] & set(data.columns))
+        return data
+
+    def check(self, data: pd.DataFrame | None = None, **kwargs) -> 'Tex':
         """
-        Prepare contents of the cardlatex.tex document
+        Raise CheckError for any problems in the rows to compile and the templates which would fail compilation: TeX
+        special characters in values, missing image files and unknown <$variables$>; found without running XeLaTeX,
+        nor writing the .xlsx file
         """
-        build_all = kwargs.get('build_all', False)
+        data = self._load_data(write=False, **kwargs) if data is None else data
+        rows = list(dict.fromkeys(self._rows(data, **kwargs)))
+        data = data.reindex(rows)
+        texts = self._texts()
+        typeset, files = variables(texts)
 
-        template = prepare_template(self._template, self._config)
-        tex = prepare_inputs(self._tex, self._path.parent)
+        problems = check_variables(typeset | files, self._columns) if self._columns else []
+        problems.extend(check_values(data, sorted(typeset), sorted(files)))
 
-        # \begin{tikzcard}[dpi]{width}{height}{
-        tikz = r'\begin{tikzcard}[' + self._config.dpi + ']{' + self._config.width + '}{' + self._config.height + '}'
-        texts = [self._config.front] + ([self._config.back] if self.has_back else [])
+        directories = self._graphics_directories(prepare_inputs(self._tex, self._dir))
+        for file, names in graphics(texts, data).items():
+            try:
+                find_file(file, *directories)
+            except FileNotFoundError:
+                problems.extend(Problem(row, columns, f'image {file} not found') for row, columns in names)
+
+        if problems:
+            problems.sort(key=lambda p: (-1 if p.row is None else p.row, str(p.column)))
+            message = f'{self._path}: {len(problems)} problem(s) found before compiling, see --escape and --no-check'
+            raise CheckError('\n'.join([message] + [f'  {p}' for p in problems]), problems)
+        return self
+
+    def variants(self) -> List['Tex']:
+        """
+        The cards of every variant in the .xlsx file (see matrix.variants), each built as <name>.<variant>.tex and
+        sharing the configuration, data and cache (i.e. resampled images) of these cards; or [self] without variants
+        """
+        if self._data is not None or not self._variables:
+            return [self]
+        # columns for new <$variables$> are not written, as the variants are checked against the .xlsx file as it is
+        self._load_or_generate_xlsx(write=False)
+        if not self._sheets:
+            return [self]
+
+        cards = []
+        for name, data in variants(self._sheets).items():
+            if not name:
+                return [self]
+            variant = copy.copy(self)
+            variant._path = self._path.with_name(f'{self._path.stem}.{name}{self._path.suffix}')
+            variant._data = data
+            variant._xlsx = None
+            variant._build_tex = self.cache_dir / variant._path.name
+            cards.append(variant)
+        return cards
+
+    def shards(self, size: int, **kwargs) -> List[dict]:
+        """
+        The rows to compile, in shards of at most size rows, each with the contents of the .tex file and the directory
+        against which its paths are resolved, i.e. the arguments of api.render()
+        """
+        data = self._load_data(**kwargs)
+        rows = self._rows(data, **kwargs)
+        data = data.reindex(rows).reset_index(drop=True)
+        data = data.where(data.notna(), '').astype(str)
+        return [{'tex': self._tex, 'base_dir': self._dir.resolve().as_posix(), 'rows': data[i:i + size].to_dict('records')}
+                for i in range(0, len(data), size)]
+
+    def _rows(self, data: pd.DataFrame, **kwargs) -> List[int]:
+        """
+        Data rows to compile, in order
+        """
+        if kwargs.get('build_all', False) or self._config.include is None:
+            rows = list(range(max(len(data), 1)))
+        else:
+            rows = list(self._config.include)
+        # --where, else \cardlatex[where] unless overridden like \cardlatex[include]
+        if expression := kwargs.get('where', None) or (None if kwargs.get('build_all', False) else self._config.where):
+            selected = set(where(data, expression))
+            rows = [row for row in rows if row in selected]
+        # rows pulled from the artifact store are not compiled again
+        return [row for row in rows if row not in self._artifacts]
+
+    @staticmethod
+    def _copies(data: pd.DataFrame, row: int) -> int:
+        try:
+            return int(data['copies'][row])
+        except (KeyError, ValueError):
+            return 1
+
+    def _faces(self, data: pd.DataFrame, **kwargs) -> int:
+        """
+        Number of card faces, i.e. pages, compiled
+        """
+        return sum(self._copies(data, row) for row in self._rows(data, **kwargs)) * len(self._texts())
+
+    def _prepare_tex(self, data: pd.DataFrame, rows: List[int] | None = None, failed: Iterable[int] = (), **kwargs):
+        """
+        Prepare contents of the cardlatex.tex document, with a placeholder for each row in failed
+        """
+        rows = self._rows(data, **kwargs) if rows is None else rows
+        failed = set(failed)
+
+        tikz = self._tikzcard()
+        texts = self._texts()
 
         if len(data) == 0:
             data = pd.DataFrame(index=[None], columns=[None])
 
         content = []
         toggles = set()
-        for row in range(len(data)) if build_all or self._config.include is None else self._config.include:
-            try:
-                copies = int(data['copies'][row])
-            except (KeyError, ValueError):
-                copies = 1
+        for row in rows:
+            copies = self._copies(data, row)
 
             row_content = []
             for i, text in enumerate(texts):
+                if i in self._static:
+                    # the static part of the template is included as typeset by build(), on as many lines
+                    static, dynamic, layer, path = self._static[i]
+                    text = static_node.replace('<$path$>', path.resolve().as_posix())
+                    if layer != 'main':
+                        text = r'\begin{pgfonlayer}{' + layer + '}' + text + r'\end{pgfonlayer}'
+                    text = text + '\n' * static.count('\n') + dynamic
+
+                if row in failed:
+                    row_id = f'% ROW {row} FAILED\n'
+                    row_content.append(tikz + row_id + placeholder.replace('<$row$>', str(row + 1)) + '\\end{tikzcard}%\n')
+                    continue
+
                 text_toggles = ['']
                 for key in self._variables:
                     item = data[key][row]
@@ -177,7 +417,21 @@ class Tex:
             for c in range(copies):
                 content.extend(row_content)
 
-        content = '\n'.join(content)
+        return self._prepare_document('\n'.join(content), toggles)
+
+    def _tikzcard(self, environment: str = 'tikzcard') -> str:
+        # \begin{tikzcard}[dpi]{width}{height}{
+        return r'\begin{' + environment + '}[' + self._config.dpi + ']{' + self._config.width + '}{' + self._config.height + '}'
+
+    def _texts(self) -> List[str]:
+        return [self._config.front] + ([self._config.back] if self.has_back else [])
+
+    def _prepare_document(self, content: str, toggles: Iterable[str] = ()):
+        r"""
+        Wrap content in the template, the user tex and its \newtoggle definitions
+        """
+        template = prepare_template(self._template, self._config)
+        tex = prepare_inputs(self._tex, self._dir)
         toggles = '\n'.join([r'\newtoggle{' + value + '}' for value in toggles])
 
         graphicpaths = r"""
@@ -209,159 +463,428 @@ class Tex:
         return tex, '\n'.join(tex_draft)
 
     def build(self, **kwargs) -> 'Tex':
-        if self.completed:
+        if self.completed or self._xdvipdfmx:
             return self
 
         self.cache_dir.mkdir(exist_ok=True, parents=True)
+        self._build_dir = build_dir = self._get_build_dir(**kwargs)
+        build_dir.mkdir(exist_ok=True, parents=True)
+        self._static = {}
 
-        data = self._load_or_generate_xlsx()
+        self._build_tex = build_tex = self._get_build_tex(build_dir)
+
+        data = self._load_data(write=False, **kwargs)
         logging.info(f'{self._path}: xlsx loaded:\n\n{data.to_string()}\n')
+        if not self._rows(data, **kwargs):
+            raise ValueError(f'{self._path}: no rows to compile, see \\cardlatex[include] and \\cardlatex[where]')
+        if not kwargs.get('no_check', False):
+            try:
+                self.check(data, **kwargs)
+            except CheckError as e:
+                if not kwargs.get('keep_going', False):
+                    raise
+                print(e, file=sys.stderr)
+        # only once checked, so that unknown <$variables$> are reported on every build until added to the .xlsx file
+        self._write_xlsx()
+        if self._pull(data, **kwargs):
+            self._completed = True
+            return self
         tex, tex_draft = self._prepare_tex(data, **kwargs)
         logging.info(f'{self._path}: tex content:\n\n{tex}\n')
 
         path_log = self._path.with_suffix('.log')
         path_tex = self._path.with_suffix('.cardlatex.tex')
-        cache_tex = self.cache_dir / self._path.name
-        cache_log = cache_tex.with_suffix('.log')
-
-        def xelatex(tex_path: Path = cache_tex):
-            cmd = f'xelatex.exe -interaction=nonstopmode "{tex_path.stem}".tex'
-            if (pdf_path := tex_path.with_suffix('.pdf')).exists():
-                os.remove(pdf_path)
-            subprocess.run(cmd, cwd=tex_path.parent, capture_output=False, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
-
-        def xelatex_read_log(tex_path: Path = cache_tex, log_path: Path = cache_log, check_for_errors: bool = False):
-            logging.info(f'{path_tex}: reading log contents at {log_path}')
-            with open(log_path, 'r') as f:
-                output = f.read()
-
-            if check_for_errors:
-                message = [f'XeLaTeX compilation error(s), see {path_log.resolve()}.']
-                errors_with_lines = {m.span()[0]: m for m in re.finditer(r'! .*?l\.(\d+).*?\n{2}', output, re.DOTALL)}
-                errors_all = [m for m in re.finditer(r'! .*$', output, re.MULTILINE) if m.span()[0] not in errors_with_lines]
-
-                if len(errors_all) > 0 or len(errors_with_lines) > 0:
-                    shutil.copy(cache_log, path_log)
-                    shutil.copy(cache_tex, path_tex)
-
-                    tex_content = self._tex.split('\n')
-                    with open(tex_path) as f:
-                        tex_path_content = f.read().split('\n')
-                    line_row = {l: (match.group(1), match.group(2).lower()) for match, l in [(re.search(r'\\begin{tikzcard}.*% ROW (\d+) (FRONT|BACK)', line), l) for l, line in enumerate(tex_path_content)] if match}
-
-                    for em in errors_with_lines.values():
-                        error_line = int(em.group(1))
-                        if error_line < min(line_row.keys()):
-                            message.append('\n' + em.group())
-                        else:
-                            error_row = [key for key in line_row.keys() if key - error_line <= 0][-1]
-                            row_id, edge = line_row[error_row]
-                            tex_edge_line = [l for l, line in enumerate(tex_content) if re.search(r'\\cardlatex\[' + edge + ']', line)][-1]
-                            tex_line = tex_edge_line + error_line - error_row - 3
-                            tex_path_line = error_line - 3
-
-                            message.extend(['\n' + em.group(), f'>> Error at l. {tex_line} for row {row_id} ({edge})', '>> ' + tex_content[tex_line - 1].strip('\t'), '>> ' + tex_path_content[tex_path_line].strip('\t')])
-                        
-                    for em in errors_all:
-                        message.append('\n' + em.group())
-
-                if not tex_path.with_suffix('.pdf').exists():
-                    message.append(f'\nNo PDF built; no pages of output!')
-
-                if len(message) > 1:
-                    raise subprocess.SubprocessError('\n'.join(message))
-
-            return output
+        build_log = build_tex.with_suffix('.log')
+        build_report = build_tex.with_suffix('.errors.json')
+        fail_fast = kwargs.get('fail_fast', False)
+        # files are found relative to the resampled images of a draft, else relative to the .tex file
+        source_dir = self.cache_dir if kwargs.get('draft', False) else self._dir
+        inputs = [] if build_dir.resolve() == source_dir.resolve() else [source_dir]
+        faces = self._faces(data, **kwargs)
+        if build_report.exists():
+            os.remove(build_report)
+
+        def xelatex_check(tex_path: Path, log_path: Path, log: Log):
+            message = [f'XeLaTeX compilation error(s), see {path_log.resolve()}.']
+            if log.aborted:
+                message[0] += ' XeLaTeX was aborted at the first error (--fail-fast).'
+            errors_with_lines = [(error, line) for error, line in log.errors if line is not None]
+            errors_all = [error for error, line in log.errors if line is None]
+
+            rows, unattributed = {}, []
+            if len(errors_all) > 0 or len(errors_with_lines) > 0:
+                if log_path.exists():
+                    shutil.copy(log_path, path_log)
+                if tex_path != path_tex:
+                    shutil.copy(tex_path, path_tex)
+
+                tex_content = self._tex.split('\n')
+                with open(tex_path) as f:
+                    tex_path_content = f.read().split('\n')
+                line_row = {l: (match.group(1), match.group(2).lower()) for match, l in [(re.search(r'\\begin{tikzcard}.*% ROW (\d+) (FRONT|BACK)', line), l) for l, line in enumerate(tex_path_content)] if match}
+
+                for em, error_line in errors_with_lines:
+                    if not line_row or error_line < min(line_row.keys()):
+                        message.append('\n' + em)
+                        unattributed.append(em)
+                    else:
+                        error_row = [key for key in line_row.keys() if key - error_line <= 0][-1]
+                        row_id, edge = line_row[error_row]
+                        tex_edge_line = [l for l, line in enumerate(tex_content) if re.search(r'\\cardlatex\[' + edge + ']', line)][-1]
+                        tex_line = tex_edge_line + error_line - error_row - 3
+                        tex_path_line = error_line - 3
+
+                        message.extend(['\n' + em, f'>> Error at l. {tex_line} for row {row_id} ({edge})', '>> ' + tex_content[tex_line - 1].strip('\t'), '>> ' + tex_path_content[tex_path_line].strip('\t')])
+                        rows.setdefault(int(row_id), []).append(em)
+
+                for em in errors_all:
+                    message.append('\n' + em)
+                    unattributed.append(em)
+
+            if not tex_path.with_suffix('.xdv').exists():
+                message.append(f'\nNo PDF built; no pages of output!')
+                unattributed.append('No PDF built; no pages of output!')
+
+            if len(message) > 1:
+                raise CompilationError('\n'.join(message), rows, unattributed)
+
+        def xelatex_rows(tex_path: Path, log_path: Path, rows: List[int], failed: Iterable[int] = ()) -> CompilationError | None:
+            with open(tex_path, 'w') as f:
+                f.write(self._prepare_tex(data, rows, failed, **kwargs)[0])
+            try:
+                xelatex_check(tex_path, log_path, xelatex(tex_path, fail_fast, inputs=inputs))
+            except CompilationError as e:
+                return e
+
+        def isolate(tex_path: Path, log_path: Path, rows: List[int], error: CompilationError | None = None) -> dict[int, List[str]]:
+            """
+            Narrow compilation errors down to the rows which cause them; by the % ROW markers, or else by halving
+            """
+            if rows and error is None:
+                error = xelatex_rows(tex_path, log_path, rows)
+            if error is None:
+                return {}
+            if len(rows) == 1:
+                return {rows[0]: [*error.rows.get(rows[0], []), *error.unattributed]}
+
+            suspects = [] if error.unattributed else [row for row in rows if row in error.rows]
+            if not suspects or len(suspects) == len(rows):
+                suspects = rows[:len(rows) // 2]
+            return isolate(tex_path, log_path, suspects) | isolate(tex_path, log_path, [row for row in rows if row not in suspects])
+
+        def keep_going(tex_path: Path, log_path: Path, error: CompilationError) -> Log:
+            rows = list(dict.fromkeys(self._rows(data, **kwargs)))
+            # errors outside of any row (e.g. in the user tex) can not be quarantined
+            if xelatex_rows(tex_path, log_path, rows[:1], failed=rows[:1]):
+                raise error
+
+            print(f'{self._path}: compilation failed, isolating the offending rows', file=sys.stderr)
+            failed = isolate(tex_path, log_path, rows, error)
+            with open(build_report, 'w') as f:
+                json.dump({'tex': self._path.resolve().as_posix(),
+                           'failed': [{'row': row + 1,
+                                       'data': {key: '' if pd.isna(data[key][row]) else str(data[key][row]) for key in self._variables},
+                                       'errors': errors} for row, errors in sorted(failed.items())]}, f, indent=2)
+            print(f'{self._path}: {len(failed)} row(s) failed to compile, see {self._path.with_suffix(".errors.json")}', file=sys.stderr)
+
+            with open(tex_path, 'w') as f:
+                f.write(self._prepare_tex(data, failed=failed, **kwargs)[0])
+            with Progress(self._path.name, 'compile', faces) as progress:
+                return xelatex(tex_path, fail_fast, progress, inputs)
+
+        def xelatex_pdf(tex_path: Path = build_tex, log_path: Path = build_log):
+            # convert the .xdv in the background while the log is checked, see self.wait()
+            with Progress(self._path.name, 'compile', faces) as progress:
+                log = xelatex(tex_path, fail_fast, progress, inputs)
+            process = xdvipdfmx(xdv_path, inputs) if (xdv_path := tex_path.with_suffix('.xdv')).exists() and not log.errors else None
+            try:
+                xelatex_check(tex_path, log_path, log)
+            except CompilationError as e:
+                if process:
+                    process.kill()
+                    process.wait()
+                if not kwargs.get('keep_going', False):
+                    raise
+                log = keep_going(tex_path, log_path, e)
+                process = xdvipdfmx(xdv_path, inputs) if xdv_path.exists() and not log.errors else None
+                xelatex_check(tex_path, log_path, log)
+            except Exception:
+                if process:
+                    process.kill()
+                    process.wait()
+                raise
+            return process
+
+        def externalize() -> str:
+            """
+            Typeset the static part of each template once, to be included by every card instead
+            """
+            draft = kwargs.get('draft', False)
+            if not kwargs.get('no_externalize', False) and len(self._rows(data, **kwargs)) > 1:
+                for i, text in enumerate(self._texts()):
+                    static, dynamic, layer = split_static(text)
+                    if not static:
+                        continue
+
+                    content = self._tikzcard('statictikzcard') + '% STATIC\n' + static + '\n\\pgfresetboundingbox\n\\end{statictikzcard}%\n'
+                    static_tex = self._prepare_document(content)[0]
+                    # keyed by the contents of its images, which must be found as \includegraphics would
+                    directories = self._graphics_directories(static_tex)
+                    try:
+                        stamps = [f'{r.group(1)}:{file_hash(find_file(r.group(1), *directories))}'
+                                  for r in re.finditer(r'\\includegraphics\s*(?:\[[^]]*])?\{([^}]+)}', static)]
+                    except FileNotFoundError as e:
+                        logging.info(f'{self._path}: static part of template {i} not externalized, {e}')
+                        continue
+                    # a draft is typeset with the resampled images
+                    static_pdf = self.cache_dir / f'static-{sha256(static_tex + "".join(stamps) + str(draft))}.pdf'
+
+                    if not static_pdf.exists():
+                        static_path = build_dir / f'{self._path.stem}.static.tex'
+                        with open(static_path, 'w') as f:
+                            f.write(static_tex)
+                        try:
+                            log = xelatex(static_path, fail_fast=True, inputs=inputs)
+                            if log.errors or not static_path.with_suffix('.xdv').exists():
+                                logging.warning(f'{self._path}: static part of template {i} not externalized, {log.errors}')
+                                continue
+                            wait_xdvipdfmx(xdvipdfmx(static_path.with_suffix('.xdv'), inputs))
+                            shutil.move(static_path.with_suffix('.pdf'), static_pdf)
+                        finally:
+                            for suffix in ['.tex', '.log', '.aux', '.xdv', '.pdf']:
+                                if (path := static_path.with_suffix(suffix)).exists():
+                                    os.remove(path)
+                        logging.info(f'{self._path}: externalized static part of template {i} to {static_pdf}')
+
+                    self._static[i] = (static, dynamic, layer, static_pdf)
+
+            # remove static parts typeset for previous versions of the templates
+            for path in self.cache_dir.glob('static-*.pdf'):
+                if path not in [static_pdf for *_, static_pdf in self._static.values()]:
+                    os.remove(path)
+
+            return self._prepare_tex(data, **kwargs)[0]
 
         logging.info(f'{self._path}: resampled missing images')
         if kwargs.get('draft', False):
-            with open(cache_tex, 'w') as f:
+            with open(build_tex, 'w') as f:
                 f.write(tex_draft)
-            logging.info(f'{self._path}: wrote draft tex contents to {cache_tex}')
+            logging.info(f'{self._path}: wrote draft tex contents to {build_tex}')
 
             # resample existing images
-            for directory, _, filenames in os.walk(self._cache_dir):
-                if (root := Path(directory)) != self._cache_dir:
-                    for file in filenames:
-                        img = Image(self._path.parent, self.cache_dir)
-                        try:
-                            img.find_source_from_cache(root / file)
-                            img.resample()
-                        except FileNotFoundError as e:
-                            logging.error(f'{self._path}: {e}')
+            cached = [Path(directory) / file for directory, _, filenames in os.walk(self._cache_dir)
+                      if Path(directory) != self._cache_dir for file in filenames]
+            with Progress(self._path.name, 'resample', len(cached), 'images') as progress:
+                for file in cached:
+                    img = Image(self._dir, self.cache_dir)
+                    try:
+                        img.find_source_from_cache(file)
+                        img.resample()
+                    except FileNotFoundError as e:
+                        logging.error(f'{self._path}: {e}')
+                    progress.advance()
             logging.info(f'{self._path}: resampled existing images')
 
             while True:
-                xelatex()
-                log = xelatex_read_log(check_for_errors=False)
+                with Progress(self._path.name, 'discover', faces) as progress:
+                    log = xelatex(build_tex, progress=progress, inputs=inputs)
 
                 # gather \graphicspath items from log
-                base_path = self._path.parent
+                base_path = self._dir
                 graphicspaths = [base_path]
-                try:
-                    tex_graphicspaths = re.search(r'cardlatex@graphicpaths\n(.+?)\n', log).group(1)
-                    for path in tex_graphicspaths[1:-1].split('}{'):
+                if log.graphicspaths:
+                    for path in log.graphicspaths[1:-1].split('}{'):
                         if is_relative(path):
                             graphicspaths.append(base_path / path)
                     for path in graphicspaths:
                         if not path.is_relative_to(base_path):
                             raise ValueError(f'{path} is not relative to the base directory {base_path}')
-                except AttributeError:
-                    pass  # no graphicspath other than base found
 
                 # gather missing images from log
-                not_found = []
-                for pattern in [r'! LaTeX Error: File `(.+)\' not found', r'LaTeX Warning: File `(.+)\' not found']:
-                    not_found.extend(r.group(1) for r in re.finditer(pattern, log))
-                not_found = set(not_found)
+                not_found = log.missing
 
                 # resample missing images
                 if not_found:
                     print(f'resampling missing images: {not_found}')
-                    for file in not_found:
-                        img = Image(self._path.parent, self.cache_dir)
-                        img.find_source_from_directories(file, *graphicspaths)
-                        img.resample()
+                    with Progress(self._path.name, 'resample', len(not_found), 'images') as progress:
+                        for file in not_found:
+                            img = Image(self._dir, self.cache_dir)
+                            img.find_source_from_directories(file, *graphicspaths)
+                            img.resample()
+                            progress.advance()
                     logging.info(f'{self._path}: resampled missing images')
                 else:
                     break
-            with open(cache_tex, 'w') as f:
-                f.write(tex)
-            xelatex()
-            logging.info(f'{self._path}: wrote tex contents to {cache_tex}')
-            xelatex_read_log(check_for_errors=True)
+
+        with open(build_tex, 'w') as f:
+            f.write(externalize())
+        logging.info(f'{self._path}: wrote tex contents to {build_tex}')
+        self._xdvipdfmx = xelatex_pdf()
+
+        return self
+
+    def _graphics_directories(self, tex: str) -> List[Path]:
+        r"""
+        Directories in which \includegraphics finds files, by the \graphicspath definitions in tex
+        """
+        directories = [self._dir]
+        for m in re.finditer(r'\\graphicspath\{((?:\{[^}]*})+)}', tex):
+            directories.extend(self._dir / path for path in m.group(1)[1:-1].split('}{') if path and is_relative(path))
+        return directories
+
+    def _artifact_key(self, tex: str, **kwargs) -> str:
+        """
+        Key of the PDF compiled from tex in an artifact store: tex (i.e. the template, the user tex and the data), the
+        contents of the files it includes, the options which change the output, and the version of cardlatex
+        """
+        directories = self._graphics_directories(tex)
+        files = {}
+        for r in re.finditer(r'\\includegraphics\s*(?:\[[^]]*])?\{([^}]+)}', tex):
+            try:
+                files[r.group(1)] = file_hash(find_file(r.group(1), *directories))
+            except FileNotFoundError:
+                files[r.group(1)] = None
+
+        options = {key: bool(kwargs.get(key, False)) for key in ['draft', 'keep_going', 'no_externalize']}
+        return sha256(json.dumps([version, tex, files, options]))
+
+    def _pull(self, data: pd.DataFrame, **kwargs) -> bool:
+        """
+        Pull the output of these cards from the artifact store, or else that of as many rows as possible, which are
+        then not compiled; returns whether the output is complete
+        """
+        self._store = open_store(kwargs.get('artifact_cache', None))
+        self._artifacts = {}
+        if self._store is None:
+            return False
+
+        draft = int(kwargs.get('draft', False))
+        self._order = self._rows(data, **kwargs)
+        self._key = self._artifact_key(self._prepare_tex(data, **kwargs)[draft], **kwargs)
+        if self._store.get(self._key, self.output):
+            logging.info(f'{self._path}: pulled {self._key} from the artifact store')
+            return True
+
+        self._keys, self._pages = {}, {}
+        for row in dict.fromkeys(self._order):
+            # keyed by the contents of the row without its % ROW marker, so not by its position in the data
+            tex = re.sub(r'% ROW \d+ ', '% ROW ', self._prepare_tex(data, [row], **kwargs)[draft])
+            self._keys[row] = self._artifact_key(tex, **kwargs)
+            self._pages[row] = self._copies(data, row) * len(self._texts())
+            if self._store.get(self._keys[row], path := self.cache_dir / f'{self._path.stem}.row{row}.pdf'):
+                self._artifacts[row] = path
+        logging.info(f'{self._path}: pulled {len(self._artifacts)} of {len(self._keys)} rows from the artifact store')
+
+        if len(self._artifacts) == len(self._keys):
+            self._combine([self._artifacts[row] for row in self._order])
+            self._store.put(self._key, self.output)
+            return True
+        return False
+
+    def _push(self):
+        """
+        Complete the output of self.build() with any rows pulled by self._pull(), and push it and each row it compiled
+        to the artifact store; except for rows replaced by placeholders. Output compiled in full is left as it is.
+        """
+        failed = set()
+        if (report := self._build_tex.with_suffix('.errors.json')).exists():
+            with open(report) as f:
+                failed = {entry['row'] - 1 for entry in json.load(f)['failed']}
+
+        rows = [row for row in self._order if row not in self._artifacts]
+        try:
+            files = split_pdf(self.output, *[self._pages[row] for row in rows])
+        except ValueError as e:
+            logging.warning(f'{self._path}: {e}, not pushed to the artifact store')
+            return
+
+        pulled = bool(self._artifacts)
+        for row, file in zip(rows, files):
+            if row not in self._artifacts:
+                if row not in failed:
+                    self._store.put(self._keys[row], file)
+                self._artifacts[row] = file
+        if pulled:
+            self._combine([self._artifacts[row] for row in self._order], files)
         else:
-            with open(path_tex, 'w') as f:
-                f.write(tex)
-            xelatex(path_tex)
-            xelatex_read_log(path_tex, path_tex.with_suffix('.log'), check_for_errors=True)
-
-            # delete, copy or move output to cache_dir to prepare for self.release()
-            for suffix, action, args in [('.synctex.gz', os.remove, ()),
-                                         ('.aux', os.remove, ()),
-                                         ('.log', shutil.move, (cache_log,)),
-                                         ('.pdf', shutil.move, (self._cache_output_pdf,)),
-                                         ('.tex', shutil.copy, (cache_tex,))]:
-                path = path_tex.with_suffix(suffix)
-                if path.exists():
-                    action(*(path, *args))
-            logging.info(f'{self._path}: moved output files to cache at {self._cache_dir}')
+            for file in files:
+                os.remove(file)
+        if not failed:
+            self._store.put(self._key, self.output)
+        logging.info(f'{self._path}: pushed {len(set(rows) - failed)} rows to the artifact store')
+
+    def _combine(self, files: List[Path], remove: Iterable[Path] = ()):
+        # the output of self.build(), from the PDF files of its parts in order, after which these and remove are removed
+        combine_pdf(*files)
+        transfer(files[0], self.output)
+        for file in {*files, *remove}:
+            if file.exists():
+                os.remove(file)
+
+    def assemble(self, pdfs: List[bytes], **kwargs) -> 'Tex':
+        """
+        Combine the PDF files of the shards of these cards (see self.shards), built elsewhere, as the output of self.build()
+        """
+        self._build_dir = build_dir = self._get_build_dir(**kwargs)
+        build_dir.mkdir(exist_ok=True, parents=True)
+        self._build_tex = self._get_build_tex(build_dir)
+
+        files = []
+        for i, pdf in enumerate(pdfs):
+            files.append(file := self._build_tex.with_suffix(f'.{i}.pdf'))
+            file.write_bytes(pdf)
+        self._combine(files)
+
+        self._completed = True
+        return self
+
+    def wait(self) -> 'Tex':
+        """
+        Wait for the xdvipdfmx conversion started by self.build() and prepare its output for self.release()
+        """
+        if self._xdvipdfmx is None:
+            return self
+
+        process, self._xdvipdfmx = self._xdvipdfmx, None
+        wait_xdvipdfmx(process)
+
+        for suffix in ['.synctex.gz', '.aux', '.xdv']:
+            if (path := self._build_tex.with_suffix(suffix)).exists():
+                os.remove(path)
+        if self._store:
+            self._push()
 
         self._completed = True
         return self
 
     def release(self):
+        """
+        Move the output files from the build directory next to the .tex file
+        """
         if self.completed:
-            output = self.cache_dir / self._path.name
-            log, pdf = output.with_suffix('.log'), output.with_suffix('.pdf')
-
-            shutil.copy(output.with_suffix('.tex'), path_tex := self._path.with_suffix('.cardlatex.tex'))
-            logging.info(f'{self._path}: copied tex to {path_tex}')
-            if log.exists():
-                shutil.copy(output.with_suffix('.log'), path_log := self._path.with_suffix('.log'))
-                logging.info(f'{self._path}: copied tex to {path_log}')
-            if pdf.exists():
-                shutil.move(output.with_suffix('.pdf'), path_pdf := self._path.with_suffix('.pdf'))
-                logging.info(f'{self._path}: copied tex to {path_pdf}')
+            for suffix, path in [('.tex', self._path.with_suffix('.cardlatex.tex')),
+                                 ('.log', self._path.with_suffix('.log')),
+                                 ('.pdf', self._path.with_suffix('.pdf')),
+                                 ('.errors.json', self._path.with_suffix('.errors.json'))]:
+                if (output := self._build_tex.with_suffix(suffix)).exists():
+                    transfer(output, path)
+                    logging.info(f'{self._path}: moved {output} to {path}')
+                elif suffix == '.errors.json' and path.exists():
+                    os.remove(path)
+            self._discard_build_dir()
 
             logging.info(f'{self._path}: released')
+
+    def discard(self):
+        """
+        Remove the output files from the build directory, instead of releasing them; also those of a failed build
+        """
+        for suffix in ['.log', '.pdf', '.errors.json']:
+            if (output := self._build_tex.with_suffix(suffix)).exists():
+                os.remove(output)
+        self._discard_build_dir()
+
+    def _discard_build_dir(self):
+        # a build_dir of its own is removed, but never the project directory or cache_dir
+        if self._build_dir not in [self._path.parent, self.cache_dir]:
+            shutil.rmtree(self._build_dir, ignore_errors=True)
@@ -1,17 +1,25 @@
+import io
+import json
 import os
 import shutil
+import threading
+import time
 import traceback
 from itertools import combinations, chain
 from pathlib import Path
 from typing import Callable
 
+import pandas as pd
 import pytest
 from click import BaseCommand
 from click.testing import CliRunner
-from pikepdf import Pdf
+from pikepdf import Name, Pdf, Stream, parse_content_stream
 
 from cardlatex.__main__ import build
-from cardlatex.tex import Tex
+from cardlatex.api import render
+from cardlatex.check import CheckError
+from cardlatex.distributed import serve
+from cardlatex.tex import Tex, CompilationError
 
 args_build_params = [['all'], ['combine'], ['print'], ['draft']]
 
@@ -121,6 +129,26 @@ def test_build(args_build: tuple[str, str], kwargs_build: dict):
         run(build, None, *prepare(xlsx_name, *tex_files), **kwargs_build)
 
 
+def test_build_externalize():
+    tex_file, = prepare('default', 'static')
+    statics = []
+    for kwargs in [{}, {'draft': None}, {}]:
+        run(build, None, tex_file, **kwargs)
+        with Pdf.open(Path(tex_file).with_suffix('.pdf')) as pdf:
+            assert len(pdf.pages) == 3
+        static, = Tex.get_cache_dir(tex_file).glob('static-*.pdf')
+        statics.append(static.name)
+
+        # transparent outside of what the static part draws, e.g. over the background layer of the dynamic part
+        with Pdf.open(static) as pdf:
+            streams = [*pdf.pages, *[obj for obj in pdf.objects if isinstance(obj, Stream) and obj.get('/Subtype') == Name.Form]]
+            operators = {str(operator) for stream in streams for _, operator in parse_content_stream(stream)}
+            assert not operators & {'f', 'F', 'f*', 'B', 'B*', 'b', 'b*'}
+
+    # a draft is typeset with the resampled images, and so never included in the print output
+    assert statics[0] != statics[1] and statics[0] == statics[2]
+
+
 def test_build_expected_exception(args_build_fail: tuple[str, str, Exception]):
     tex_files, xlsx_name, expected_exception = args_build_fail
     run(build, expected_exception, *prepare(xlsx_name, *tex_files))
@@ -149,6 +177,123 @@ def test_cache(args_build: tuple[str, str]):
                     assert file.stat().st_mtime_ns == stats[file]
 
 
+def test_build_keep_going():
+    tex_file, = prepare('default', 'back')
+    xlsx_file = Path(tex_file).with_suffix('.xlsx')
+    data = pd.read_excel(xlsx_file, sheet_name='cardlatex', dtype=str, na_filter=False)
+    data.loc[1, 'title'] = 'this & that'
+    data.to_excel(xlsx_file, index=False, sheet_name='cardlatex')
+
+    run(build, CheckError, tex_file)
+    run(build, CompilationError, tex_file, **{'no-check': ''})
+    run(build, None, tex_file, **{'keep-going': ''})
+
+    with open(Path(tex_file).with_suffix('.errors.json')) as f:
+        assert [failed['row'] for failed in json.load(f)['failed']] == [2]
+    with Pdf.open(Path(tex_file).with_suffix('.pdf')) as pdf:
+        assert len(pdf.pages) == 8
+
+
+def test_build_check():
+    tex_file, = prepare('default', 'default')
+    xlsx_file = Path(tex_file).with_suffix('.xlsx')
+    data = pd.read_excel(xlsx_file, sheet_name='cardlatex', dtype=str, na_filter=False)
+    data.loc[0, 'title'] = '100% & more'
+    data.loc[1, 'art'] = 'missing'
+    data.to_excel(xlsx_file, index=False, sheet_name='cardlatex')
+
+    with pytest.raises(CheckError) as e:
+        Tex(tex_file).check()
+    assert [(p.row, p.column) for p in e.value.problems] == [(0, 'title'), (0, 'title'), (1, 'art')]
+    with pytest.raises(CheckError) as e:
+        Tex(tex_file).check(escape=True)
+    assert [(p.row, p.column) for p in e.value.problems] == [(1, 'art')]
+    run(build, SystemExit, tex_file, check='')
+    assert not Path(tex_file).with_suffix('.pdf').exists()
+
+
+def test_build_check_new_variable():
+    tex_file, = prepare('default', 'default')
+    xlsx_file = Path(tex_file).with_suffix('.xlsx')
+    tex = Path(tex_file).read_text()
+    Path(tex_file).write_text(tex.replace('<$title$>}', '<$title$> <$subtitle$>}'))
+    xlsx = xlsx_file.read_bytes()
+
+    # reported on every run, without adding the column to the .xlsx file
+    for _ in range(2):
+        with pytest.raises(CheckError) as e:
+            Tex(tex_file).check()
+        assert [(p.row, p.column) for p in e.value.problems] == [(None, 'subtitle')]
+        run(build, SystemExit, tex_file, check='')
+        run(build, CheckError, tex_file)
+        assert xlsx_file.read_bytes() == xlsx
+
+    run(build, None, tex_file, **{'no-check': ''})
+    assert 'subtitle' in pd.read_excel(xlsx_file, sheet_name='cardlatex').columns
+
+
+def test_build_optimize():
+    tex_file, = prepare('default', 'default')
+    run(build, None, tex_file, optimize='', **{'optimize-dpi': '30'})
+
+    # a 2.3cm by 3.3cm card (2cm by 3cm, of which 0.3cm bleed, with 0.3cm bleed on either side) at 30 dpi
+    with Pdf.open(Path(tex_file).with_suffix('.pdf')) as pdf:
+        images = [obj for obj in pdf.objects if isinstance(obj, Stream) and obj.get('/Subtype') == Name.Image]
+        assert images and all(image.Width <= 28 or image.Height <= 39 for image in images)
+
+
+def test_build_artifact_cache(tmp_path: Path):
+    tex_file, = prepare('default', 'default')
+    run(build, None, tex_file, **{'artifact-cache': tmp_path.as_posix()})
+    pdf = Path(tex_file).with_suffix('.pdf').read_bytes()
+    artifacts = {file for file in tmp_path.rglob('*') if file.is_file()}
+    assert len(artifacts) == 4  # the deck and each of its 3 rows
+
+    # a fresh cache directory, as on another machine
+    shutil.rmtree(Tex.get_cache_dir(tex_file))
+    os.remove(Path(tex_file).with_suffix('.pdf'))
+    run(build, None, tex_file, **{'artifact-cache': tmp_path.as_posix()})
+    assert Path(tex_file).with_suffix('.pdf').read_bytes() == pdf
+    assert {file for file in tmp_path.rglob('*') if file.is_file()} == artifacts
+
+
+def test_build_workers(tmp_path: Path):
+    address = (tmp_path / 'worker.sock').as_posix()
+    threading.Thread(target=serve, args=(address,), daemon=True).start()
+    while not os.path.exists(address):
+        time.sleep(0.1)
+
+    tex_file, = prepare('default', 'default')
+    run(build, None, tex_file, workers=address, **{'shard-size': '1'})
+    with Pdf.open(Path(tex_file).with_suffix('.pdf')) as pdf:
+        assert len(pdf.pages) == 3
+
+
+@pytest.mark.parametrize('draft', [False, True])
+def test_render(draft: bool):
+    tex_file, = prepare('default', 'default')
+    output_dir = Path(tex_file).parent
+    files = set(output_dir.rglob('*'))
+
+    with open(tex_file) as f:
+        tex = f.read()
+    rows = pd.read_excel(Path(tex_file).with_suffix('.xlsx'), sheet_name='cardlatex', dtype=str, na_filter=False)
+    with Pdf.open(io.BytesIO(render(tex, rows, base_dir=output_dir, draft=draft))) as pdf:
+        assert len(pdf.pages) == 3
+    assert set(output_dir.rglob('*')) == files
+
+
+def test_render_build_dir(tmp_path: Path):
+    tex_file, = prepare('default', 'default')
+    with open(tex_file) as f:
+        tex = f.read()
+    rows = pd.read_excel(Path(tex_file).with_suffix('.xlsx'), sheet_name='cardlatex', dtype=str, na_filter=False)
+    for _ in range(2):
+        with Pdf.open(io.BytesIO(render(tex, rows, base_dir=Path(tex_file).parent, build_dir=tmp_path))) as pdf:
+            assert len(pdf.pages) == 3
+    assert list(tmp_path.iterdir()) == []
+
+
 def test_build_specific():
     run(build, None, *prepare('copies', *['default']), **{'all': ''})
 
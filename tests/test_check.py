@@ -0,0 +1,38 @@
+import pandas as pd
+import pytest
+
+from cardlatex.check import Problem, check_values, check_variables, escape, graphics, variables
+
+texts = [r'\node {\includegraphics[width=\cardx]{art/<$art$>.png}}; \node {<$title$>};',
+         r'\if<$title$>{\node {\includegraphics{<$art$>_<$side$>}};}{}']
+
+
+def test_variables():
+    assert variables(texts) == ({'title'}, {'art', 'side'})
+    assert check_variables(['title', 'art', 'side'], ['title', 'art']) == [Problem(None, 'side', '<$side$> is not a column of the data')]
+
+
+@pytest.mark.parametrize('value, message', [
+    ('this & that', r'unescaped &, use \&'),
+    ('100%', r'unescaped %, use \%'),
+    ('#1', r'unescaped #, use \#'),
+    ('$x', r'unbalanced $, use \$'),
+    ('{x', 'unbalanced braces'),
+    ('x_1', r'_ outside of math, use \_'),
+    ('x^2', r'^ outside of math, use \^{}'),
+    (r'this \& $x_1^2$ \{', None),
+])
+def test_check_values(value: str, message: str | None):
+    data = pd.DataFrame({'title': ['fine', value], 'art': ['a_b', 'c']})
+    assert check_values(data, ['title'], ['art']) == ([Problem(1, 'title', message)] if message else [])
+
+
+def test_escape():
+    data = pd.DataFrame({'title': ['this & that', '$x_1$ and x_1', '$5 ^ 2', None]})
+    assert escape(data, ['title'])['title'].tolist()[:3] == [r'this \& that', r'$x_1$ and x\_1', r'\$5 \^{} 2']
+    assert check_values(escape(data, ['title']), ['title']) == []
+
+
+def test_graphics():
+    data = pd.DataFrame({'art': ['a', 'b', ''], 'side': ['front', '', 'back'], 'title': ['', '', '']})
+    assert graphics(texts, data) == {'art/a.png': [(0, 'art')], 'art/b.png': [(1, 'art')], 'a_front': [(0, 'art, side')]}
@@ -0,0 +1,67 @@
+from typing import List
+
+import pytest
+
+from cardlatex.engine import Log, MAX_PRINT_LINE
+
+
+def feed(lines: List[str]) -> Log:
+    log = Log()
+    for line in lines:
+        log.feed(line + '\n')
+    log.close()
+    return log
+
+
+def wrap(line: str) -> List[str]:
+    # as TeX writes a long line to its terminal
+    return [line[i:i + MAX_PRINT_LINE] for i in range(0, len(line), MAX_PRINT_LINE)]
+
+
+def test_wrapped_lines():
+    path = 'art/' + 'very-long-directory-name/' * 5 + 'background.png'
+    message = f'! LaTeX Error: File `{path}\' not found.'
+    lines = wrap(message)
+    assert len(lines) > 1 and len(lines[0]) == MAX_PRINT_LINE
+    log = feed(lines + ['', 'l.12 \\includegraphics{art/...}', ''])
+    assert log.missing == {path}
+    assert log.errors == [('\n'.join([message, '', 'l.12 \\includegraphics{art/...}']), 12)]
+
+
+def test_wrapped_at_exit():
+    # a line of exactly MAX_PRINT_LINE characters at the end of the output is not lost
+    line = f'LaTeX Warning: File `{"a" * 40}.png\' not found'.ljust(MAX_PRINT_LINE)
+    log = feed([line])
+    assert log.missing == {'a' * 40 + '.png'}
+
+
+@pytest.mark.parametrize('lines, errors', [
+    (['! Undefined control sequence.', 'l.42 \\foo', '', 'more output'], [('! Undefined control sequence.\nl.42 \\foo', 42)]),
+    (['! Emergency stop.', '<*> cards.tex', '', '*** (job aborted, no legal \\end found)'], [('! Emergency stop.', None)]),
+    (['! Missing $ inserted.', '<inserted text>', '                $', 'l.7 a_b', '', '! Undefined control sequence.',
+      'l.9 \\bar', ''],
+     [('! Missing $ inserted.\n<inserted text>\n                $\nl.7 a_b', 7), ('! Undefined control sequence.\nl.9 \\bar', 9)]),
+])
+def test_errors(lines: List[str], errors: list):
+    log = feed(lines)
+    assert log.errors == errors
+
+
+def test_error_completed():
+    # an error is complete (and --fail-fast kills XeLaTeX) at the empty line after its l.N, or else at the next error
+    lines = ['! Undefined control sequence.', 'l.42 \\foo', '            bar', '', '! Emergency stop.', '<*> cards.tex',
+             '', '! Undefined control sequence.']
+    log = Log()
+    completed = [log.feed(line + '\n') for line in lines]
+    assert completed == [False, False, False, True, False, False, False, True]
+    assert log.errors == [('! Undefined control sequence.\nl.42 \\foo\n            bar', 42), ('! Emergency stop.', None)]
+    log.close()
+    assert len(log.errors) == 3
+
+
+def test_pages():
+    log = feed(['(./cards.tex [1] [2{/usr/share/fonts/map.map}] [3', '<./art/background.png>]',
+                '[4] (./cards.aux) [10]', 'Output written on cards.xdv (10 pages).'])
+    assert log.pages == 10
+    log = feed(['\\node[anchor=north] at (0,0) {[a]};', 'Overfull \\hbox (1.5pt too wide) in paragraph [] []'])
+    assert log.pages == 0
@@ -0,0 +1,35 @@
+import pandas as pd
+import pytest
+
+from cardlatex.matrix import dimensions, parse_variant, provided, variants
+
+sheets = {
+    'cardlatex': pd.DataFrame({'title@lang=en': ['a', 'b'], 'title@lang=de': ['x', 'y'], 'body': ['1', '2']}),
+    'cardlatex@lang=de,finish=gloss': pd.DataFrame({'body': ['glanz']}),
+    'notes@lang=fr': pd.DataFrame({'body': ['?']}),
+}
+
+
+@pytest.mark.parametrize('name, expected', [
+    ('title@lang=en', ('title', {'lang': 'en'})),
+    ('cardlatex@lang=de,finish=gloss', ('cardlatex', {'lang': 'de', 'finish': 'gloss'})),
+    ('title', None),
+    ('e@mail', None),
+])
+def test_parse_variant(name: str, expected):
+    assert parse_variant(name) == expected
+
+
+def test_dimensions():
+    assert dimensions(sheets) == {'lang': ['en', 'de'], 'finish': ['gloss']}
+    assert provided(sheets) == {'lang', 'finish', 'title', 'body'}
+
+
+def test_variants():
+    frames = variants(sheets)
+    assert list(frames) == ['en.gloss', 'de.gloss']
+    assert frames['en.gloss'].to_dict('list') == {'body': ['1', '2'], 'title': ['a', 'b'], 'lang': ['en', 'en'],
+                                                  'finish': ['gloss', 'gloss']}
+    assert frames['de.gloss'].to_dict('list') == {'body': ['glanz', ''], 'title': ['x', 'y'], 'lang': ['de', 'de'],
+                                                  'finish': ['gloss', 'gloss']}
+    assert list(variants({'cardlatex': pd.DataFrame({'title': ['a']})})) == ['']
@@ -0,0 +1,41 @@
+import os
+from pathlib import Path
+
+from pikepdf import Dictionary, Name, Pdf, Stream
+
+from cardlatex.pdf import combine_pdf, split_pdf
+
+
+def deck(path: Path, pages: int) -> Path:
+    # every page draws the same form, which draws the same (incompressible) image
+    pdf = Pdf.new()
+    image = Stream(pdf, os.urandom(1 << 18), Type=Name.XObject, Subtype=Name.Image, Width=256, Height=341,
+                   ColorSpace=Name.DeviceRGB, BitsPerComponent=8)
+    form = Stream(pdf, b'q 100 0 0 100 0 0 cm /Im0 Do Q', Type=Name.XObject, Subtype=Name.Form, BBox=[0, 0, 100, 100],
+                  Resources=Dictionary(XObject=Dictionary(Im0=image)))
+    for i in range(pages):
+        page = pdf.add_blank_page(page_size=(100, 100))
+        page.obj.Resources = Dictionary(XObject=Dictionary(Fm0=form))
+        page.obj.Contents = pdf.make_stream(f'/Fm0 Do BT ({i}) Tj ET'.encode())
+    pdf.save(path)
+    return path
+
+
+def test_combine_shared(tmp_path: Path):
+    size = deck(file := tmp_path / 'deck.pdf', 10).stat().st_size
+    files = split_pdf(file, *[1] * 10)
+    assert sum(part.stat().st_size for part in files) > 9 * size
+
+    combine_pdf(*files)
+    assert files[0].stat().st_size < size * 1.1
+    with Pdf.open(files[0]) as pdf:
+        assert [page.obj.Contents.read_bytes() for page in pdf.pages] == [f'/Fm0 Do BT ({i}) Tj ET'.encode() for i in range(10)]
+        assert len({page.Resources.XObject.Fm0.objgen for page in pdf.pages}) == 1
+
+
+def test_combine_distinct(tmp_path: Path):
+    sizes = [deck(file := tmp_path / f'{name}.pdf', 2).stat().st_size for name in 'ab']
+    combine_pdf(tmp_path / 'a.pdf', file)
+    assert (tmp_path / 'a.pdf').stat().st_size > sum(sizes) * 0.9
+    with Pdf.open(tmp_path / 'a.pdf') as pdf:
+        assert len({page.Resources.XObject.Fm0.objgen for page in pdf.pages}) == 2
@@ -0,0 +1,70 @@
+import io
+import json
+
+import pytest
+
+from cardlatex import progress as module
+from cardlatex.progress import JSON_INTERVAL, Progress
+
+
+class Clock:
+    def __init__(self, now: float = 100.):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(module.time, 'monotonic', clock)
+    return clock
+
+
+def events(stream: io.StringIO) -> list[dict]:
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+def test_events(clock: Clock):
+    stream = io.StringIO()
+    with Progress('cards.tex', 'compile', total=10, stream=stream) as progress:
+        clock.now += 2
+        progress.advance(4)
+    clock.now += 1
+
+    progress_event, done_event = events(stream)
+    assert progress_event == {'event': 'progress', 'deck': 'cards.tex', 'stage': 'compile', 'unit': 'cards', 'done': 4,
+                              'total': 10, 'rate': 2.0, 'eta': 3.0, 'elapsed': 2.0}
+    assert done_event['event'] == 'done' and done_event['done'] == 4 and done_event['elapsed'] == 2.0
+
+
+def test_throttle(clock: Clock):
+    stream = io.StringIO()
+    progress = Progress('cards.tex', 'resample', total=100, unit='images', stream=stream)
+    for _ in range(10):
+        clock.now += JSON_INTERVAL / 4
+        progress.advance()
+    # reported at the first update, then at most once per JSON_INTERVAL
+    assert [event['done'] for event in events(stream)] == [1, 5, 9]
+
+    progress.close()
+    assert events(stream)[-1]['event'] == 'done' and events(stream)[-1]['done'] == 10
+
+
+def test_eta(clock: Clock):
+    progress = Progress('cards.tex', 'compile', total=30, stream=io.StringIO())
+    assert progress.eta is None
+    clock.now += 10
+    progress.update(5)
+    assert progress.rate == 0.5 and progress.eta == 50.
+    progress.update(35)
+    assert progress.eta == 0.
+    assert Progress('cards.tex', 'compile', stream=io.StringIO()).eta is None
+
+
+def test_nothing_done():
+    stream = io.StringIO()
+    with Progress('cards.tex', 'compile', total=10, stream=stream):
+        pass
+    assert stream.getvalue() == ''
@@ -0,0 +1,42 @@
+import pandas as pd
+import pytest
+
+from cardlatex.config import Config
+from cardlatex.query import numeric, where
+
+data = pd.DataFrame({'type': ['spell', 'trap', 'spell', ''], 'cost': ['4', '2', '3', ''],
+                     'card title': ['fire  ball', 'pit', 'frost', '']})
+
+
+def test_numeric():
+    frame = numeric(data)
+    assert frame['cost'].tolist()[:3] == [4, 2, 3] and pd.isna(frame['cost'][3])
+    assert frame['type'].tolist() == data['type'].tolist()
+
+
+@pytest.mark.parametrize('expression, rows', [
+    ('type == "spell" and cost > 3', [0]),
+    ('type in ["spell", "trap"]\n    and not cost == 2', [0, 2]),
+    ('`card title`.str.contains("f")', [0, 2]),
+    ('cost != cost', [3]),
+    ('`card title` == "fire  ball"', [0]),
+    ('`card title` == "fire ball"', []),
+])
+def test_where(expression: str, rows: list[int]):
+    assert where(data, expression) == rows
+
+
+@pytest.mark.parametrize('expression', ['cost + 1', 'unknown > 1', 'type =='])
+def test_where_invalid(expression: str):
+    with pytest.raises(ValueError):
+        where(data, expression)
+
+
+def test_config_where():
+    config = Config(r'''
+\cardlatex[width]{2cm}
+\cardlatex[height]{3cm}
+\cardlatex[where]{type == "spell"}
+\cardlatex[front]{<$type$>}
+''')
+    assert config.where == 'type == "spell"'
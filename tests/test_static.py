@@ -0,0 +1,33 @@
+import pytest
+
+from cardlatex.static import split_static, statements
+
+frame = r'''
+    \begin{background}
+        \node[anchor=north west] at (0,0) {\includegraphics[width=\cardx]{art/background.png}};
+    \end{background}
+    \draw[rounded corners] (TL) rectangle (BR);'''
+
+
+def test_statements():
+    assert statements(r'\node {a; b}; \begin{scope} \clip (0,0); \end{scope} % ;') == [
+        r'\node {a; b};', r' \begin{scope} \clip (0,0); \end{scope}', ' % ;']
+
+
+@pytest.mark.parametrize('dynamic, static, layer', [
+    (r'\node at (T) {<$title$>};', frame, 'background'),
+    (r'\if<$title$>{\node at (T) {<$title$>};}{}', frame, 'background'),
+    (r'\begin{background}\node {<$title$>};\end{background}', '', 'main'),
+])
+def test_split_static(dynamic: str, static: str, layer: str):
+    assert split_static(frame + dynamic) == (static, frame[len(static):] + dynamic, layer)
+
+
+@pytest.mark.parametrize('text', [
+    r'\tikzset{every node/.style={red}} \node {<$title$>};',
+    r'\clip (TL) rectangle (BR); \node {<$title$>};',
+    r'\node (frame) at (C) {}; \node at (frame.north) {<$title$>};',
+    r'\begin{foreground} \node {a}; \end{foreground} \node {<$title$>};',
+])
+def test_split_static_none(text: str):
+    assert split_static(text)[0] == ''